@@ -0,0 +1,4 @@
+# Authorship: {{{
+# Written by: Dario C. Lewczyk
+# Date: 10-19-2026
+#}}}
@@ -0,0 +1,602 @@
+# Authorship: {{{
+# Written by: Dario C. Lewczyk
+# Date: 10-19-2026
+#}}}
+# Imports: {{{
+import numpy as np
+import pandas as pd
+from jana_tools.conv import units
+from jana_tools.analysis.reflection_table import ReflectionTable, expand_composite_classes
+#}}}
+# Globals: {{{
+SIMILARITY_METRICS = ('rwp', 'cosine', 'pearson', 'xcorr')
+#}}}
+# batch_interp: {{{
+def batch_interp(xs:list = None, ys:list = None, grid = None):
+    '''
+    Interpolates many patterns onto one grid with a single call to np.interp.
+
+    Each pattern is shifted along x by a multiple of the total span so
+    that all of the patterns can be concatenated into one monotonic array.
+    The grid is shifted the same way for each row so one interpolation covers
+    every pattern. Points on the grid outside of a pattern's range are nan.
+
+    xs: list of 1D arrays of x values (one per pattern)
+    ys: list of 1D arrays of intensities (one per pattern)
+    grid: 1D array of x values to interpolate onto
+
+    returns a 2D float64 array of shape (len(xs), len(grid))
+    '''
+    grid = np.asarray(grid, dtype = float)
+    n = len(xs)
+    xs = [np.asarray(x, dtype = float) for x in xs]
+    ys = [np.asarray(y, dtype = float) for y in ys]
+    lengths = np.array([len(x) for x in xs])
+    out = np.full((n, len(grid)), np.nan)
+    valid = lengths > 0
+    if not valid.any():
+        return out
+    # Concatenate the patterns: {{{
+    x_cat = np.concatenate([x for x, ok in zip(xs, valid) if ok])
+    y_cat = np.concatenate([y for y, ok in zip(ys, valid) if ok])
+    rows = np.repeat(np.arange(valid.sum()), lengths[valid])
+    offsets = np.concatenate(([0], np.cumsum(lengths[valid])[:-1]))
+    x_min = np.minimum.reduceat(x_cat, offsets)
+    x_max = np.maximum.reduceat(x_cat, offsets)
+    #}}}
+    # Shift each pattern so they do not overlap: {{{
+    lo = min(x_cat.min(), grid.min())
+    span = max(x_cat.max(), grid.max()) - lo + 1.0
+    x_shift = (x_cat - lo) + rows*span
+    order = np.argsort(x_shift, kind = 'stable') # Only reorders within a pattern if that pattern is unsorted
+    grid_shift = (grid - lo)[None, :] + (np.arange(valid.sum())*span)[:, None]
+    #}}}
+    # Interpolate and mask: {{{
+    interpolated = np.interp(grid_shift.ravel(), x_shift[order], y_cat[order]).reshape(-1, len(grid))
+    outside = (grid[None, :] < x_min[:, None]) | (grid[None, :] > x_max[:, None])
+    interpolated[outside] = np.nan
+    out[valid] = interpolated
+    #}}}
+    return out
+#}}}
+# _prepare_rows: {{{
+def _prepare_rows(block = None, metric:str = 'cosine'):
+    '''
+    Gets a block of patterns ready for a matrix product.
+    nan (outside of a pattern's range) is treated as zero intensity.
+
+    returns (prepared rows, squared norms of the rows)
+    '''
+    block = np.asarray(block, dtype = float)
+    if metric in ('pearson', 'xcorr'):
+        with np.errstate(invalid = 'ignore'):
+            block = block - np.nanmean(block, axis = 1, keepdims = True)
+    block = np.nan_to_num(block, nan = 0.0)
+    sq_norms = np.einsum('ij,ij->i', block, block)
+    if metric in ('cosine', 'pearson', 'xcorr'):
+        norms = np.sqrt(sq_norms)
+        norms[norms == 0] = 1.0
+        block = block / norms[:, None]
+    return block, sq_norms
+#}}}
+# _block_metric: {{{
+def _block_metric(a = None, b = None, a_sq = None, b_sq = None, metric:str = 'cosine', max_lag:int = 0):
+    '''
+    Computes the metric between every row of a and every row of b
+    using one matrix product (one per lag for xcorr).
+    '''
+    dot = a @ b.T
+    if metric in ('cosine', 'pearson'):
+        return dot
+    # Cross-correlation: the best overlap of a with b shifted by up to max_lag points: {{{
+    if metric == 'xcorr':
+        npts = a.shape[1]
+        for lag in range(1, min(max_lag, npts - 1) + 1):
+            np.maximum(dot, a[:, :-lag] @ b[:, lag:].T, out = dot)
+            np.maximum(dot, a[:, lag:] @ b[:, :-lag].T, out = dot)
+        return dot
+    #}}}
+    # Rwp-style: sqrt(sum((yi - yj)^2) / (0.5*sum(yi^2 + yj^2))): {{{
+    denominator = 0.5*(a_sq[:, None] + b_sq[None, :])
+    numerator = np.maximum(a_sq[:, None] + b_sq[None, :] - 2*dot, 0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return np.sqrt(np.where(denominator > 0, numerator/denominator, 0.0))
+    #}}}
+#}}}
+# pairwise_similarity: {{{
+def pairwise_similarity(intensity = None, metric:str = 'cosine', block_size:int = 512, dtype = np.float32, memmap_fn:str = None, max_lag:int = 10):
+    '''
+    Computes an N x N matrix of a metric between every pair of rows in intensity.
+    Only blocks of block_size rows are ever held in memory at double precision
+    so this works for memory-mapped arrays of thousands of patterns.
+
+    intensity: 2D array (patterns x grid points) on a common grid (see resample_patterns)
+    metric: 
+        rwp: Rwp-style difference, sqrt(sum((yi - yj)^2) / (0.5*sum(yi^2 + yj^2))). 0 is identical
+        cosine: cosine similarity of the patterns. 1 is identical
+        pearson: zero-lag normalized cross-correlation (Pearson correlation). 1 is identical
+        xcorr: normalized cross-correlation, the largest value over shifts of up to max_lag grid points. 
+               1 is identical (up to a shift). Tolerates small peak shifts between patterns.
+    block_size: the number of rows handled at once
+    dtype: dtype of the output matrix
+    memmap_fn: if given, the matrix is a memory-mapped .npy file at this path
+    max_lag: the largest shift (in grid points) tried by xcorr
+    '''
+    metric = metric.lower()
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f'Unknown metric: {metric}. Use one of: {SIMILARITY_METRICS}')
+    n = len(intensity)
+    if memmap_fn:
+        matrix = np.lib.format.open_memmap(memmap_fn, mode = 'w+', dtype = dtype, shape = (n, n))
+    else:
+        matrix = np.empty((n, n), dtype = dtype)
+    # Loop over the upper triangle of blocks: {{{
+    for a_start in range(0, n, block_size):
+        a_stop = min(a_start + block_size, n)
+        a, a_sq = _prepare_rows(intensity[a_start:a_stop], metric)
+        for b_start in range(a_start, n, block_size):
+            b_stop = min(b_start + block_size, n)
+            if b_start == a_start:
+                b, b_sq = a, a_sq
+            else:
+                b, b_sq = _prepare_rows(intensity[b_start:b_stop], metric)
+            values = _block_metric(a, b, a_sq, b_sq, metric, max_lag)
+            matrix[a_start:a_stop, b_start:b_stop] = values
+            matrix[b_start:b_stop, a_start:a_stop] = values.T
+    #}}}
+    if memmap_fn:
+        matrix.flush()
+    return matrix
+#}}}
+# sweep_clusters: {{{
+def sweep_clusters(x = None, tol:float = None, widths = None, width_scale:float = None):
+    '''
+    Groups positions that are closer together than a tolerance by sorting them 
+    once and breaking the sorted list wherever the gap to the next position is too large.
+
+    x: 1D array of positions
+    tol: a fixed tolerance in the units of x
+    widths: 1D array of peak widths (e.g. fwhm) in the units of x
+    width_scale: if given with widths, neighbours are grouped if their gap is 
+                less than width_scale * the mean width of the two. 
+                If tol is also given, the larger of the two tolerances is used.
+
+    returns an array of cluster labels (0 to n_clusters - 1, ordered by position) 
+    in the order of x. nan positions are labeled -1.
+    '''
+    x = np.asarray(x, dtype = float)
+    labels = np.full(len(x), -1, dtype = np.int64)
+    finite = np.flatnonzero(np.isfinite(x))
+    if len(finite) == 0:
+        return labels
+    order = finite[np.argsort(x[finite], kind = 'stable')]
+    gaps = np.diff(x[order])
+    # Tolerance for each gap: {{{
+    threshold = np.zeros(len(gaps))
+    if tol is not None:
+        threshold = np.maximum(threshold, tol)
+    if widths is not None and width_scale is not None:
+        sorted_widths = np.nan_to_num(np.asarray(widths, dtype = float)[order], nan = 0.0)
+        threshold = np.maximum(threshold, width_scale*0.5*(sorted_widths[:-1] + sorted_widths[1:]))
+    #}}}
+    labels[order] = np.concatenate(([0], np.cumsum(gaps > threshold)))
+    return labels
+#}}}
+# JANA_Analysis: {{{
+class JANA_Analysis:
+    # __init__: {{{
+    def __init__(self):
+        self.pattern_series = {} # Holds the most recent result of resample_patterns
+        self.similarity = {} # Holds the most recent result of similarity_matrix
+        self._order_stats_cache = {} # {(index, by, modulation_axis): (hklm_fingerprint, statistics)}
+    #}}}
+    # _get_pattern_x: {{{
+    def _get_pattern_x(self, idx:int = 0, x_axis:str = 'q', lambda_angstrom:float = None):
+        '''
+        Returns the x values of the pattern for a dataset on the axis requested.
+        If the pattern does not already have that axis, it is converted from tth.
+        '''
+        pattern = self.jana_data[idx]['pattern']
+        x = pattern.get(x_axis)
+        if x is not None and len(x) == len(pattern['yobs']):
+            return np.asarray(x, dtype = float)
+        if lambda_angstrom is None:
+            lambda_angstrom = pattern['header'].get('lambda', 1.540593)
+        return units.convert(pattern['tth'], 'tth', x_axis, lambda_angstrom = lambda_angstrom)
+    #}}}
+    # resample_patterns: {{{
+    def resample_patterns(self,
+            indices:list = None,
+            x_axis:str = 'q',
+            grid = None,
+            npts:int = None,
+            x_range:tuple = None,
+            dtype = np.float32,
+            memmap_fn:str = None,
+            chunk_size:int = 256,
+            lambda_angstrom:float = None,
+            ):
+        '''
+        Puts every pattern['yobs'] in jana_data onto a shared grid so that
+        the whole series is stored as one contiguous 2D array (datasets x grid points).
+
+        indices: the jana_data indices to use. If None, all datasets with a pattern are used.
+        x_axis: q or tth (anything in units.UNITS works if the pattern can be converted)
+        grid: the grid to use. If None, one is made from x_range and npts
+        npts: the number of grid points. If None, uses the longest pattern
+        x_range: (min, max) for the grid. If None, covers all of the patterns
+        dtype: the dtype of the 2D array. float32 halves the memory needed
+        memmap_fn: if given, the 2D array is a memory-mapped .npy file at this path
+        chunk_size: the number of patterns interpolated together. Bounds the memory used
+        lambda_angstrom: used if a pattern has no lambda in its header
+
+        returns a dictionary with: x_axis, x, indices, intensity
+        the result is also stored in self.pattern_series
+        '''
+        # Get the datasets: {{{
+        if indices is None:
+            indices = [idx for idx, entry in self.jana_data.items() if 'pattern' in entry]
+        indices = list(indices)
+        xs = [self._get_pattern_x(idx, x_axis, lambda_angstrom) for idx in indices]
+        #}}}
+        # Make the grid: {{{
+        if grid is None:
+            if x_range is None:
+                x_range = (
+                    np.nanmin([np.nanmin(x) for x in xs if len(x)]),
+                    np.nanmax([np.nanmax(x) for x in xs if len(x)]),
+                )
+            if npts is None:
+                npts = max(len(x) for x in xs)
+            grid = np.linspace(x_range[0], x_range[1], npts)
+        grid = np.asarray(grid, dtype = float)
+        #}}}
+        # Allocate the 2D array: {{{
+        shape = (len(indices), len(grid))
+        if memmap_fn:
+            intensity = np.lib.format.open_memmap(memmap_fn, mode = 'w+', dtype = dtype, shape = shape)
+        else:
+            intensity = np.empty(shape, dtype = dtype)
+        #}}}
+        # Interpolate in chunks: {{{
+        for start in range(0, len(indices), chunk_size):
+            stop = min(start + chunk_size, len(indices))
+            ys = [self.jana_data[idx]['pattern']['yobs'] for idx in indices[start:stop]]
+            intensity[start:stop] = batch_interp(xs[start:stop], ys, grid)
+        if memmap_fn:
+            intensity.flush()
+        #}}}
+        self.pattern_series = {
+            'x_axis': x_axis,
+            'x': grid,
+            'indices': indices,
+            'intensity': intensity,
+        }
+        return self.pattern_series
+    #}}}
+    # _get_series: {{{
+    def _get_series(self, series:dict = None, indices:list = None, x_axis:str = 'q', **kwargs):
+        '''
+        Returns series if one is given (e.g. a result of resample_patterns).
+        Otherwise, the patterns are resampled so that the result always matches 
+        the current jana_data and the grid arguments given.
+        '''
+        if series is not None:
+            return series
+        return self.resample_patterns(indices = indices, x_axis = x_axis, **kwargs)
+    #}}}
+    # similarity_matrix: {{{
+    def similarity_matrix(self,
+            metric:str = 'cosine',
+            indices:list = None,
+            x_axis:str = 'q',
+            block_size:int = 512,
+            dtype = np.float32,
+            memmap_fn:str = None,
+            max_lag:int = 10,
+            series:dict = None,
+            **kwargs
+            ):
+        '''
+        Computes an N x N matrix comparing every pair of patterns in jana_data on a common grid.
+
+        metric: rwp, cosine, pearson, or xcorr (see pairwise_similarity)
+        indices: the jana_data indices to compare. If None, all patterns are used
+        x_axis: q or tth for the common grid
+        block_size: the number of patterns handled at once. Bounds the memory used
+        dtype: dtype of the matrix
+        memmap_fn: if given, the matrix is a memory-mapped .npy file at this path
+        max_lag: the largest shift (in grid points) tried by xcorr
+        series: a result of resample_patterns to use. If None, the patterns are resampled
+        kwargs: passed to resample_patterns (e.g. npts, x_range, grid)
+
+        returns a dictionary with: metric, max_lag, indices, matrix
+        the result is also stored in self.similarity
+        '''
+        series = self._get_series(series, indices, x_axis, **kwargs)
+        matrix = pairwise_similarity(series['intensity'], metric, block_size, dtype, memmap_fn, max_lag)
+        self.similarity = {
+            'metric': metric.lower(),
+            'max_lag': max_lag,
+            'indices': list(series['indices']),
+            'matrix': matrix,
+        }
+        return self.similarity
+    #}}}
+    # most_similar: {{{
+    def most_similar(self,
+            index:int = 0,
+            k:int = 5,
+            metric:str = 'cosine',
+            indices:list = None,
+            x_axis:str = 'q',
+            block_size:int = 512,
+            max_lag:int = 10,
+            series:dict = None,
+            similarity:dict = None,
+            **kwargs
+            ):
+        '''
+        Returns the k datasets most similar to jana_data[index] as a list of 
+        (jana_data index, metric value) sorted from most to least similar.
+
+        If similarity (a result of similarity_matrix) is given, its row is used
+        and metric is taken from it. Otherwise, only the one row needed is computed.
+        
+        metric: rwp, cosine, pearson, or xcorr (see pairwise_similarity)
+        block_size: the number of patterns handled at once
+        max_lag: the largest shift (in grid points) tried by xcorr
+        series: a result of resample_patterns to use. If None, the patterns are resampled
+        similarity: a result of similarity_matrix to take the row from
+        kwargs: passed to resample_patterns (e.g. npts, x_range, grid)
+        '''
+        metric = metric.lower()
+        # Get the row of the matrix: {{{
+        if similarity is not None:
+            metric = similarity['metric']
+            candidates = list(similarity['indices'])
+            if index not in candidates:
+                raise ValueError(f'Dataset {index} is not in the similarity matrix given')
+            row = np.asarray(similarity['matrix'][candidates.index(index)], dtype = float)
+        else:
+            series = self._get_series(series, indices, x_axis, **kwargs)
+            candidates = list(series['indices'])
+            if index not in candidates:
+                raise ValueError(f'Dataset {index} has no pattern in the series')
+            intensity = series['intensity']
+            target, target_sq = _prepare_rows(intensity[candidates.index(index)][None, :], metric)
+            row = np.empty(len(candidates))
+            for start in range(0, len(candidates), block_size):
+                stop = min(start + block_size, len(candidates))
+                block, block_sq = _prepare_rows(intensity[start:stop], metric)
+                row[start:stop] = _block_metric(target, block, target_sq, block_sq, metric, max_lag)[0]
+        #}}}
+        # Rank: {{{
+        order_values = row if metric == 'rwp' else -row # smallest first
+        order_values = np.array(order_values, dtype = float)
+        order_values[candidates.index(index)] = np.inf # Do not return the dataset itself
+        k = min(k, len(candidates) - 1)
+        if k <= 0:
+            return []
+        best = np.argpartition(order_values, k - 1)[:k]
+        best = best[np.argsort(order_values[best])]
+        #}}}
+        return [(candidates[i], float(row[i])) for i in best]
+    #}}}
+    # reflection_table: {{{
+    def reflection_table(self, indices:list = None, modulation_axis:str = 'b'):
+        '''
+        Puts the reflections of every dataset (or those in indices) into one 
+        ReflectionTable so that questions across the whole series can be answered with 
+        filter() and aggregate() instead of looping through the peak dictionaries.
+
+        modulation_axis: used to assign the composite_class column
+        '''
+        return ReflectionTable.from_jana_data(self.jana_data, indices, modulation_axis)
+    #}}}
+    # profile_agreement: {{{
+    def profile_agreement(self, indices:list = None, n_params:int = 0):
+        '''
+        Computes Rwp (%) and GoF from the calculated profile of each dataset 
+        (jana_data[i]['profile'], read by prf_file_parser).
+        All of the profiles are concatenated so every dataset is reduced in one pass.
+
+            Rwp = 100*sqrt(sum(w*(yobs - ycalc)^2) / sum(w*yobs^2))
+            GoF = sqrt(sum(w*(yobs - ycalc)^2) / (N - n_params))
+        with w = 1/sigma^2 (points with sigma <= 0 are ignored)
+
+        n_params: the number of refined parameters used for GoF
+
+        returns a dataframe indexed by dataset with: n_points, rwp, gof
+        '''
+        if indices is None:
+            indices = [idx for idx, entry in self.jana_data.items() if 'profile' in entry]
+        indices = list(indices)
+        profiles = [self.jana_data[idx]['profile'] for idx in indices]
+        if not profiles:
+            return pd.DataFrame(columns = ['n_points', 'rwp', 'gof'])
+        # Concatenate the profiles: {{{
+        lengths = [len(profile['yobs']) for profile in profiles]
+        ids = np.repeat(np.arange(len(profiles)), lengths)
+        yobs = np.concatenate([profile['yobs'] for profile in profiles])
+        sigma = np.concatenate([profile['sigma'] for profile in profiles])
+        difference = np.concatenate([profile['difference'] for profile in profiles])
+        #}}}
+        # Grouped sums: {{{
+        used = sigma > 0
+        weights = np.zeros_like(sigma)
+        weights[used] = 1/sigma[used]**2
+        numerator = np.bincount(ids, weights*difference**2, minlength = len(profiles))
+        denominator = np.bincount(ids, weights*yobs**2, minlength = len(profiles))
+        n_points = np.bincount(ids, used, minlength = len(profiles)).astype(int)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            rwp = 100*np.sqrt(numerator/denominator)
+            gof = np.sqrt(numerator/(n_points - n_params))
+        #}}}
+        return pd.DataFrame({'n_points': n_points, 'rwp': rwp, 'gof': gof}, index = pd.Index(indices, name = 'dataset'))
+    #}}}
+    # cluster_hklm: {{{
+    def cluster_hklm(self,
+            index:int = 0,
+            x_axis:str = 'tth',
+            tol:float = None,
+            fwhm_scale:float = None,
+            kinds:list = ('main', 'satellite'),
+            ):
+        '''
+        Groups the reflections of one dataset that fall within a tolerance of each other 
+        so near-duplicates can be plotted as one tick and handled as one entry.
+
+        index: the jana_data index
+        x_axis: tth or q. The axis the tolerance is applied on
+        tol: fixed tolerance in units of x_axis
+        fwhm_scale: group reflections closer than fwhm_scale * fwhm (converted to q if x_axis is q)
+        kinds: which reflections to include (main and/or satellite)
+
+        returns a dataframe with one row per cluster: 
+            tth, q: fsq weighted positions (unweighted if all fsq are 0)
+            x_min, x_max: the span of the cluster on x_axis
+            n_members, fsq_sum, fsq_max, 
+            kind: main, satellite, or mixed
+            hklm: list of the hklm strings 
+            members: list of (kind, peak) keys into jana_data[index]['hklm_data']
+            ht: hover text
+        the dataframe is also stored in jana_data[index]['hklm_clusters']
+        '''
+        if tol is None and fwhm_scale is None:
+            raise ValueError('You must give tol and/or fwhm_scale')
+        table = self.reflection_table([index]).filter(kind = list(kinds)).df
+        x = table[x_axis].to_numpy()
+        # Get the widths: {{{
+        widths = None
+        if fwhm_scale is not None:
+            if 'fwhm' not in table.columns:
+                raise ValueError('These reflections do not have a fwhm. Use tol instead')
+            widths = table['fwhm'].to_numpy()
+            if x_axis == 'q':
+                # dq = q/(2tan(theta)) * d(2theta) in radians
+                theta = np.radians(table['tth'].to_numpy()/2)
+                widths = np.radians(widths) * table['q'].to_numpy()/(2*np.tan(theta))
+        #}}}
+        labels = sweep_clusters(x, tol, widths, fwhm_scale)
+        keep = labels >= 0
+        table = table[keep].reset_index(drop = True)
+        labels = labels[keep]
+        n_clusters = labels.max() + 1 if len(labels) else 0
+        # Grouped reductions: {{{
+        fsq = np.nan_to_num(table['fsq'].to_numpy(), nan = 0.0)
+        n_members = np.bincount(labels, minlength = n_clusters)
+        fsq_sum = np.bincount(labels, fsq, minlength = n_clusters)
+        weights = np.where(fsq_sum[labels] > 0, fsq, 1.0)
+        weight_sum = np.bincount(labels, weights, minlength = n_clusters)
+        positions = {
+            key: np.bincount(labels, weights*table[key].to_numpy(), minlength = n_clusters)/weight_sum
+            for key in ('tth', 'q')
+        }
+        order = np.argsort(labels, kind = 'stable')
+        starts = np.concatenate(([0], np.cumsum(n_members)[:-1]))
+        x_sorted = table[x_axis].to_numpy()[order]
+        x_min = np.minimum.reduceat(x_sorted, starts) if n_clusters else np.array([])
+        x_max = np.maximum.reduceat(x_sorted, starts) if n_clusters else np.array([])
+        fsq_max = np.maximum.reduceat(fsq[order], starts) if n_clusters else np.array([])
+        n_main = np.bincount(labels, table['kind'].to_numpy() == 'main', minlength = n_clusters)
+        #}}}
+        # Member lists: {{{
+        kind_sorted = table['kind'].to_numpy()[order]
+        peak_sorted = table['peak'].to_numpy()[order]
+        hklm_sorted = (table['h'].astype(str) + ' ' + table['k'].astype(str) + ' ' + table['l'].astype(str) + ' ' + table['m'].astype(str)).to_numpy()[order]
+        members = [
+            list(zip(kind_group.tolist(), peak_group.tolist()))
+            for kind_group, peak_group in zip(np.split(kind_sorted, starts[1:]), np.split(peak_sorted, starts[1:]))
+        ] if n_clusters else []
+        hklms = [group.tolist() for group in np.split(hklm_sorted, starts[1:])] if n_clusters else []
+        cluster_kind = np.where(n_main == n_members, 'main', np.where(n_main == 0, 'satellite', 'mixed'))
+        ht = [
+            f'cluster of {n}<br>tth: {np.around(tth, 4)}<br>q: {np.around(q, 4)}<br>sum f^2: {np.around(total, 4)}<br>hklm: ' + '<br>'.join(f'({hklm})' for hklm in group)
+            for n, tth, q, total, group in zip(n_members, positions['tth'], positions['q'], fsq_sum, hklms)
+        ]
+        #}}}
+        clusters = pd.DataFrame({
+            'tth': positions['tth'],
+            'q': positions['q'],
+            'x_min': x_min,
+            'x_max': x_max,
+            'n_members': n_members,
+            'fsq_sum': fsq_sum,
+            'fsq_max': fsq_max,
+            'kind': cluster_kind,
+            'hklm': hklms,
+            'members': members,
+            'ht': ht,
+        })
+        clusters.attrs['x_axis'] = x_axis
+        self.jana_data[index]['hklm_clusters'] = clusters
+        return clusters
+    #}}}
+    # order_statistics: {{{
+    def order_statistics(self,
+            indices:list = None,
+            by:str = 'abs_m',
+            modulation_axis:str = 'b',
+            wide:bool = True,
+            ):
+        '''
+        Summarizes the reflections of each dataset grouped by satellite order (|m|) 
+        or by composite category so that modulation strength can be followed through a series.
+
+        Results are kept for each dataset and only datasets that are new 
+        or have been reparsed since the last call are recomputed, so this can be 
+        called repeatedly during a live run.
+
+        indices: the datasets to include. If None, every dataset with hklm_data is used
+        by: abs_m or composite_class
+            composite_class uses the same overlapping categories as categorize_composite_hklm 
+            (e.g. a main reflection along the modulation axis is counted in primary, secondary, and common)
+        modulation_axis: used for composite_class
+        wide: if True, returns a dataset x group table (columns are (statistic, group))
+            otherwise returns one row per (dataset, group)
+
+        statistics:
+            count: number of reflections
+            fsq_sum: summed fsq
+            fsq_mean: mean fsq
+            main_ratio: (abs_m only) summed fsq of the main (m = 0) reflections / fsq_sum of the order.
+                        Not given for composite_class since the categories mix main and satellite reflections
+        '''
+        if indices is None:
+            indices = [idx for idx, entry in self.jana_data.items() if 'hklm_data' in entry]
+        indices = list(indices)
+        if not indices:
+            return pd.DataFrame(columns = ['count', 'fsq_sum', 'fsq_mean'] + (['main_ratio'] if by == 'abs_m' else []))
+        # Find what needs to be computed: {{{
+        stale = []
+        for idx in indices:
+            cached = self._order_stats_cache.get((idx, by, modulation_axis))
+            if cached is None or cached[0] != self.jana_data[idx].get('hklm_fingerprint'):
+                stale.append(idx)
+        #}}}
+        # Grouped reductions for the stale datasets: {{{
+        if stale:
+            table = self.reflection_table(stale, modulation_axis).df
+            df = expand_composite_classes(table, modulation_axis) if by == 'composite_class' else table
+            fsq = df['fsq'].fillna(0)
+            grouped = fsq.groupby([df['dataset'], df[by]], observed = True)
+            stats = pd.DataFrame({
+                'count': grouped.count(),
+                'fsq_sum': grouped.sum(),
+                'fsq_mean': grouped.mean(),
+            })
+            dataset_level = stats.index.get_level_values('dataset')
+            if by == 'abs_m':
+                main_sum = fsq[df['m'] == 0].groupby(df['dataset'][df['m'] == 0]).sum()
+                stats['main_ratio'] = main_sum.reindex(dataset_level).fillna(0).to_numpy() / stats['fsq_sum'].to_numpy()
+            for idx in stale:
+                rows = stats[dataset_level == idx]
+                self._order_stats_cache[(idx, by, modulation_axis)] = (self.jana_data[idx].get('hklm_fingerprint'), rows)
+        #}}}
+        result = pd.concat([self._order_stats_cache[(idx, by, modulation_axis)][1] for idx in indices])
+        if wide:
+            return result.unstack(by)
+        return result
+    #}}}
+#}}}
@@ -0,0 +1,222 @@
+# Authorship: {{{
+# Written by: Dario C. Lewczyk
+# Date: 10-19-2026
+#}}}
+# Imports: {{{
+import numpy as np
+import pandas as pd
+#}}}
+# Globals: {{{
+KINDS = ['main', 'satellite']
+COMPOSITE_CLASSES = ['primary', 'secondary', 'common', 'satellites']
+FLOAT_COLUMNS = ['tth', 'q', 's', 'd-spacing', 'fsq', 'fwhm', 'tof']
+#}}}
+# _axis_masks: {{{
+def _axis_masks(h = None, k = None, l = None, m = None, modulation_axis:str = 'b'):
+    '''
+    returns (on_axis, main): the index along the modulation axis is 0, m is 0
+    '''
+    axis = {'a': h, 'b': k, 'c': l}.get(modulation_axis)
+    if axis is None:
+        raise ValueError(f'modulation_axis must be a, b, or c. Not: {modulation_axis}')
+    return np.asarray(axis) == 0, np.asarray(m) == 0
+#}}}
+# composite_classes: {{{
+def composite_classes(h = None, k = None, l = None, m = None, modulation_axis:str = 'b'):
+    '''
+    Vectorized version of the categories used by categorize_composite_hklm.
+    Since primary, secondary, and common overlap there, each reflection
+    gets the most specific category it belongs to:
+        common: m = 0 and the index along the modulation axis is 0
+        primary: m = 0 (and not common)
+        secondary: m != 0 and the index along the modulation axis is 0
+        satellites: m != 0 and the index along the modulation axis is not 0
+    Use composite_memberships for the overlapping categories themselves.
+    '''
+    on_axis, main = _axis_masks(h, k, l, m, modulation_axis)
+    codes = np.select([main & on_axis, main, on_axis], [2, 0, 1], 3) # indices in COMPOSITE_CLASSES
+    return pd.Categorical.from_codes(codes, COMPOSITE_CLASSES)
+#}}}
+# composite_memberships: {{{
+def composite_memberships(h = None, k = None, l = None, m = None, modulation_axis:str = 'b'):
+    '''
+    Boolean masks of the same (overlapping) categories made by categorize_composite_hklm:
+        primary: m = 0
+        secondary: the index along the modulation axis is 0 (any m)
+        common: m = 0 and the index along the modulation axis is 0
+        satellites: m != 0 and the index along the modulation axis is not 0
+
+    returns {category: mask} in the order of COMPOSITE_CLASSES
+    '''
+    on_axis, main = _axis_masks(h, k, l, m, modulation_axis)
+    return {
+        'primary': main,
+        'secondary': on_axis,
+        'common': main & on_axis,
+        'satellites': ~main & ~on_axis,
+    }
+#}}}
+# expand_composite_classes: {{{
+def expand_composite_classes(df:pd.DataFrame = None, modulation_axis:str = 'b'):
+    '''
+    Returns a copy of a reflection table dataframe with one row for every 
+    composite category each reflection belongs to (see composite_memberships).
+    The composite_class column is replaced with that category so grouping by it 
+    gives the same membership as categorize_composite_hklm.
+    '''
+    masks = composite_memberships(df['h'].to_numpy(), df['k'].to_numpy(), df['l'].to_numpy(), df['m'].to_numpy(), modulation_axis)
+    rows = [np.flatnonzero(masks[name]) for name in COMPOSITE_CLASSES]
+    codes = np.concatenate([np.full(len(r), i, dtype = np.int8) for i, r in enumerate(rows)])
+    expanded = df.iloc[np.concatenate(rows)].reset_index(drop = True)
+    expanded['composite_class'] = pd.Categorical.from_codes(codes, COMPOSITE_CLASSES)
+    return expanded
+#}}}
+# ReflectionTable: {{{
+class ReflectionTable:
+    '''
+    A columnar (long format) table holding the reflections of every dataset in jana_data.
+    One row per reflection with:
+        dataset: the jana_data index
+        kind: main or satellite (categorical)
+        peak: the key of the reflection in jana_data[dataset]['hklm_data'][kind]['peaks']
+        composite_class: primary, secondary, common, or satellites (categorical). 
+                        The most specific category of each reflection (see composite_classes)
+        h, k, l, m, abs_m: compact integers
+        tth, q, s, d-spacing, fsq, fwhm, (tof): floats
+
+    filter() builds one boolean mask from numpy arrays for all predicates
+    so queries over millions of reflections stay fast.
+    '''
+    # __init__: {{{
+    def __init__(self, df:pd.DataFrame = None):
+        self.df = df
+    #}}}
+    # from_jana_data: {{{
+    @classmethod
+    def from_jana_data(cls, jana_data:dict = None, indices:list = None, modulation_axis:str = 'b'):
+        '''
+        Concatenates the hklm_data of each dataset into one table.
+
+        jana_data: the dictionary made by JANA_Tools
+        indices: the datasets to include. If None, every dataset with hklm_data is used
+        modulation_axis: used for the composite_class column
+        '''
+        if indices is None:
+            indices = [idx for idx, entry in jana_data.items() if 'hklm_data' in entry]
+        columns = {key: [] for key in ['dataset', 'kind', 'peak', 'h', 'k', 'l', 'm'] + FLOAT_COLUMNS}
+        # Collect columns: {{{
+        for idx in indices:
+            for kind_code, kind in enumerate(KINDS):
+                peak_dict = jana_data[idx]['hklm_data'].get(kind, {}).get('peaks', {})
+                peaks = list(peak_dict.values())
+                n = len(peaks)
+                if n == 0:
+                    continue
+                columns['dataset'].append(np.full(n, idx, dtype = np.int32))
+                columns['kind'].append(np.full(n, kind_code, dtype = np.int8))
+                columns['peak'].append(np.fromiter(peak_dict.keys(), dtype = np.int32, count = n))
+                for key in ['h', 'k', 'l', 'm']:
+                    columns[key].append(np.fromiter((peak[key] for peak in peaks), dtype = np.int64, count = n))
+                for key in FLOAT_COLUMNS:
+                    values = (peak.get(key) for peak in peaks)
+                    columns[key].append(np.fromiter((np.nan if v is None else v for v in values), dtype = float, count = n))
+        #}}}
+        # Build the dataframe: {{{
+        if not columns['dataset']:
+            return cls(pd.DataFrame(columns = ['dataset', 'kind', 'peak', 'composite_class', 'h', 'k', 'l', 'm', 'abs_m'] + FLOAT_COLUMNS))
+        data = {key: np.concatenate(value) for key, value in columns.items()}
+        hklm = {key: pd.to_numeric(data[key], downcast = 'integer') for key in ['h', 'k', 'l', 'm']}
+        df = pd.DataFrame({
+            'dataset': data['dataset'],
+            'kind': pd.Categorical.from_codes(data['kind'], KINDS),
+            'peak': data['peak'],
+            'composite_class': composite_classes(data['h'], data['k'], data['l'], data['m'], modulation_axis),
+            **hklm,
+            'abs_m': pd.to_numeric(np.abs(data['m']), downcast = 'integer'),
+        })
+        for key in FLOAT_COLUMNS:
+            if not np.all(np.isnan(data[key])):
+                df[key] = data[key]
+        #}}}
+        return cls(df)
+    #}}}
+    # __len__: {{{
+    def __len__(self):
+        return len(self.df)
+    #}}}
+    # __repr__: {{{
+    def __repr__(self):
+        return f'ReflectionTable({len(self)} reflections)\n{self.df!r}'
+    #}}}
+    # _mask: {{{
+    def _mask(self, column:str = None, predicate = None):
+        '''
+        Makes a boolean mask for one column.
+
+        predicate:
+            tuple: (min, max) inclusive. Either can be None for an open range
+            list, set, or array: the value must be one of these
+            callable: called with the column as a numpy array. Must return a boolean array
+            anything else: the value must be equal to this
+        '''
+        series = self.df[column]
+        # Categorical columns compare their integer codes: {{{
+        if isinstance(series.dtype, pd.CategoricalDtype) and not callable(predicate) and not isinstance(predicate, tuple):
+            categories = list(series.cat.categories)
+            codes = series.cat.codes.to_numpy()
+            wanted = predicate if isinstance(predicate, (list, set, np.ndarray)) else [predicate]
+            wanted = [categories.index(value) for value in wanted if value in categories]
+            return np.isin(codes, wanted)
+        #}}}
+        values = series.to_numpy()
+        if callable(predicate):
+            return np.asarray(predicate(values), dtype = bool)
+        if isinstance(predicate, tuple):
+            low, high = predicate
+            mask = np.ones(len(values), dtype = bool)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+            return mask
+        if isinstance(predicate, (list, set, np.ndarray)):
+            return np.isin(values, list(predicate))
+        return values == predicate
+    #}}}
+    # filter: {{{
+    def filter(self, **predicates):
+        '''
+        Returns a new ReflectionTable with the rows matching every predicate.
+
+        e.g. every satellite with |m| <= 2 and fsq above 1000 in datasets 0-9:
+            table.filter(kind = 'satellite', abs_m = (None, 2), fsq = (1000, None), dataset = range(10))
+
+        column names containing "-" (d-spacing) can be given with "_" (d_spacing)
+        '''
+        mask = np.ones(len(self.df), dtype = bool)
+        for column, predicate in predicates.items():
+            if column not in self.df.columns:
+                column = column.replace('_', '-')
+            if isinstance(predicate, range):
+                predicate = np.arange(predicate.start, predicate.stop, predicate.step)
+            mask &= self._mask(column, predicate)
+        return ReflectionTable(self.df[mask].reset_index(drop = True))
+    #}}}
+    # aggregate: {{{
+    def aggregate(self, by = 'dataset', column:str = 'fsq', funcs:list = ('count', 'sum', 'mean')):
+        '''
+        Groups the table and reduces one column.
+
+        by: a column name or list of column names to group by (e.g. ['dataset', 'abs_m'])
+        column: the column to reduce
+        funcs: the reductions to use (anything pandas groupby.agg accepts)
+
+        returns a dataframe with one row per group and one column per function
+        '''
+        return self.df.groupby(by, observed = True)[column].agg(list(funcs))
+    #}}}
+    # to_dataframe: {{{
+    def to_dataframe(self):
+        return self.df
+    #}}}
+#}}}
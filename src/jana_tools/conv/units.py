@@ -0,0 +1,286 @@
+# Authorship: {{{
+'''
+Written by: Dario C. Lewczyk
+Date: 10-19-2026
+Purpose:
+    Vectorized conversions between the x-axes JANA data can be expressed in.
+
+    All of the functions here accept scalars or arrays and return numpy arrays (or numpy scalars)
+    so that an entire pattern or reflection list is converted in one call.
+    None of this requires an instance of Utils so it can be used anywhere.
+
+    The units understood are:
+        tth: 2theta in degrees
+        q: momentum transfer in Å^-1 (2pi/d)
+        d: d-spacing in Å
+        s: 1/d in Å^-1
+        tof: time of flight in µs (TOF = zero + difc*d + difa*d^2)
+'''
+#}}}
+# Imports: {{{
+import numpy as np
+#}}}
+# Globals: {{{
+UNITS = ('tth', 'q', 'd', 's', 'tof')
+#}}}
+# tth_to_d: {{{
+def tth_to_d(tth = None, lambda_angstrom:float = 1.540593):
+    '''
+    tth: 2theta in degrees
+    lambda_angstrom: the wavelength in angstrom
+    '''
+    tth = np.asarray(tth, dtype = float)
+    with np.errstate(divide = 'ignore'):
+        return lambda_angstrom / (2*np.sin(np.radians(tth)/2))
+#}}}
+# d_to_tth: {{{
+def d_to_tth(d = None, lambda_angstrom:float = 1.540593):
+    '''
+    d: d-spacing in angstrom
+    lambda_angstrom: the wavelength in angstrom
+
+    d-spacings that cannot be reached with the wavelength given are returned as nan
+    '''
+    d = np.asarray(d, dtype = float)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return 2*np.degrees(np.arcsin(lambda_angstrom / (2*d)))
+#}}}
+# d_to_q: {{{
+def d_to_q(d = None):
+    '''
+    d: d-spacing in angstrom
+    '''
+    d = np.asarray(d, dtype = float)
+    with np.errstate(divide = 'ignore'):
+        return 2*np.pi/d
+#}}}
+# q_to_d: {{{
+def q_to_d(q = None):
+    '''
+    q: q in inverse angstrom
+    '''
+    q = np.asarray(q, dtype = float)
+    with np.errstate(divide = 'ignore'):
+        return 2*np.pi/q
+#}}}
+# d_to_s: {{{
+def d_to_s(d = None):
+    '''
+    d: d-spacing in angstrom
+    '''
+    d = np.asarray(d, dtype = float)
+    with np.errstate(divide = 'ignore'):
+        return 1/d
+#}}}
+# s_to_d: {{{
+def s_to_d(s = None):
+    '''
+    s: 1/d in inverse angstrom
+    '''
+    s = np.asarray(s, dtype = float)
+    with np.errstate(divide = 'ignore'):
+        return 1/s
+#}}}
+# d_to_tof: {{{
+def d_to_tof(d = None, difc:float = None, difa:float = 0.0, zero:float = 0.0):
+    '''
+    d: d-spacing in angstrom
+    difc: the linear TOF calibration constant (µs/Å)
+    difa: the quadratic TOF calibration constant (µs/Å^2)
+    zero: the TOF zero offset (µs)
+    '''
+    if difc is None:
+        raise ValueError('You must give difc to convert to or from TOF')
+    d = np.asarray(d, dtype = float)
+    return zero + difc*d + difa*d**2
+#}}}
+# tof_to_d: {{{
+def tof_to_d(tof = None, difc:float = None, difa:float = 0.0, zero:float = 0.0):
+    '''
+    tof: time of flight in µs
+    difc: the linear TOF calibration constant (µs/Å)
+    difa: the quadratic TOF calibration constant (µs/Å^2)
+    zero: the TOF zero offset (µs)
+
+    If difa is not zero, the positive root of the quadratic is used.
+    '''
+    if difc is None:
+        raise ValueError('You must give difc to convert to or from TOF')
+    tof = np.asarray(tof, dtype = float)
+    if difa == 0:
+        return (tof - zero)/difc
+    with np.errstate(invalid = 'ignore'):
+        return (-difc + np.sqrt(difc**2 + 4*difa*(tof - zero)))/(2*difa)
+#}}}
+# tth_to_q: {{{
+def tth_to_q(tth = None, lambda_angstrom:float = 1.540593):
+    '''
+    tth: 2theta in degrees
+    lambda_angstrom: the wavelength in angstrom
+    '''
+    tth = np.asarray(tth, dtype = float)
+    return 4*np.pi/lambda_angstrom * np.sin(np.radians(tth)/2)
+#}}}
+# q_to_tth: {{{
+def q_to_tth(q = None, lambda_angstrom:float = 1.540593):
+    '''
+    q: q in inverse angstrom
+    lambda_angstrom: the wavelength in angstrom
+
+    q values that cannot be reached with the wavelength given are returned as nan
+    '''
+    q = np.asarray(q, dtype = float)
+    with np.errstate(invalid = 'ignore'):
+        return 2*np.degrees(np.arcsin(q*lambda_angstrom/(4*np.pi)))
+#}}}
+# to_d: {{{
+def to_d(values = None, unit:str = 'tth', lambda_angstrom:float = 1.540593, difc:float = None, difa:float = 0.0, zero:float = 0.0):
+    '''
+    Converts values in any of the units in UNITS to d-spacing
+    '''
+    unit = unit.lower()
+    if unit == 'tth':
+        return tth_to_d(values, lambda_angstrom)
+    elif unit == 'q':
+        return q_to_d(values)
+    elif unit == 'd':
+        return np.asarray(values, dtype = float)
+    elif unit == 's':
+        return s_to_d(values)
+    elif unit == 'tof':
+        return tof_to_d(values, difc, difa, zero)
+    raise ValueError(f'Unknown unit: {unit}. Use one of: {UNITS}')
+#}}}
+# from_d: {{{
+def from_d(d = None, unit:str = 'tth', lambda_angstrom:float = 1.540593, difc:float = None, difa:float = 0.0, zero:float = 0.0):
+    '''
+    Converts d-spacings to any of the units in UNITS
+    '''
+    unit = unit.lower()
+    if unit == 'tth':
+        return d_to_tth(d, lambda_angstrom)
+    elif unit == 'q':
+        return d_to_q(d)
+    elif unit == 'd':
+        return np.asarray(d, dtype = float)
+    elif unit == 's':
+        return d_to_s(d)
+    elif unit == 'tof':
+        return d_to_tof(d, difc, difa, zero)
+    raise ValueError(f'Unknown unit: {unit}. Use one of: {UNITS}')
+#}}}
+# convert: {{{
+def convert(values = None, from_unit:str = 'tth', to_unit:str = 'q', lambda_angstrom:float = 1.540593, difc:float = None, difa:float = 0.0, zero:float = 0.0):
+    '''
+    Convert an array of values between any two of: tth, q, d, s, tof
+
+    values: scalar or array of values in from_unit
+    from_unit: the unit the values are in
+    to_unit: the unit you want
+    lambda_angstrom: wavelength used for anything involving tth
+    difc, difa, zero: TOF calibration constants used for anything involving tof
+    '''
+    from_unit = from_unit.lower()
+    to_unit = to_unit.lower()
+    # Direct routes that avoid going through d: {{{
+    if from_unit == to_unit:
+        return np.asarray(values, dtype = float)
+    if from_unit == 'tth' and to_unit == 'q':
+        return tth_to_q(values, lambda_angstrom)
+    if from_unit == 'q' and to_unit == 'tth':
+        return q_to_tth(values, lambda_angstrom)
+    #}}}
+    calibration = {'lambda_angstrom': lambda_angstrom, 'difc': difc, 'difa': difa, 'zero': zero}
+    d = to_d(values, from_unit, **calibration)
+    return from_d(d, to_unit, **calibration)
+#}}}
+# _get_dataset_value: {{{
+def _get_dataset_value(value = None, idx:int = 0, default = None):
+    '''
+    Calibration constants can be given as a single value for all datasets
+    or as a dictionary keyed by the jana_data index.
+    '''
+    if isinstance(value, dict):
+        return value.get(idx, default)
+    if value is None:
+        return default
+    return value
+#}}}
+# convert_dataset: {{{
+def convert_dataset(
+        dataset:dict = None,
+        to_units:list = ('q', 'd', 's'),
+        from_unit:str = 'tth',
+        lambda_angstrom:float = None,
+        difc:float = None,
+        difa:float = 0.0,
+        zero:float = 0.0,
+        ):
+    '''
+    Adds arrays in each of to_units to the pattern, profile, and hklm_data entries
+    of a single jana_data entry (e.g. jana_data[0]).
+
+    from_unit: the key holding the x values you are converting from (e.g. tth or tof)
+    lambda_angstrom: if None, the "lambda" value in the pattern header is used (if present)
+    difc, difa, zero: TOF calibration constants (only needed for tof)
+    '''
+    # Get the wavelength: {{{
+    if lambda_angstrom is None:
+        try:
+            lambda_angstrom = dataset['pattern']['header']['lambda']
+        except (KeyError, TypeError):
+            lambda_angstrom = 1.540593
+    calibration = {'lambda_angstrom': lambda_angstrom, 'difc': difc, 'difa': difa, 'zero': zero}
+    #}}}
+    # Collect the dictionaries holding x values: {{{
+    targets = []
+    if 'pattern' in dataset:
+        targets.append(dataset['pattern'])
+    if 'profile' in dataset:
+        targets.append(dataset['profile'])
+    for classification, block in dataset.get('hklm_data', {}).items():
+        targets.append(block)
+    #}}}
+    # Convert each: {{{
+    for target in targets:
+        if from_unit not in target or len(target[from_unit]) == 0:
+            continue
+        d = to_d(target[from_unit], from_unit, **calibration)
+        for unit in to_units:
+            if unit == from_unit:
+                continue
+            target[unit] = from_d(d, unit, **calibration)
+    #}}}
+    return dataset
+#}}}
+# convert_jana_data: {{{
+def convert_jana_data(
+        jana_data:dict = None,
+        to_units:list = ('q', 'd', 's'),
+        from_unit:str = 'tth',
+        indices:list = None,
+        lambda_angstrom = None,
+        difc = None,
+        difa = 0.0,
+        zero = 0.0,
+        ):
+    '''
+    Runs convert_dataset for every entry in jana_data (or only those in indices).
+
+    lambda_angstrom, difc, difa, zero can each either be a single value
+    or a dictionary of {index: value} to give each dataset its own calibration.
+    '''
+    if indices is None:
+        indices = list(jana_data.keys())
+    for idx in indices:
+        convert_dataset(
+            jana_data[idx],
+            to_units = to_units,
+            from_unit = from_unit,
+            lambda_angstrom = _get_dataset_value(lambda_angstrom, idx),
+            difc = _get_dataset_value(difc, idx),
+            difa = _get_dataset_value(difa, idx, 0.0),
+            zero = _get_dataset_value(zero, idx, 0.0),
+        )
+    return jana_data
+#}}}
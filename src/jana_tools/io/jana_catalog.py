@@ -0,0 +1,303 @@
+# Authorship: {{{
+# Written by: Dario C. Lewczyk
+# Date: 10-19-2026
+#}}}
+# Imports: {{{
+import os
+import sqlite3
+from jana_tools.io.jana_io import parse_m50_file
+#}}}
+# Globals: {{{
+CATALOG_EXTENSIONS = ('m50', 'prf', 'm90')
+STRUCTURE_COLUMNS = [
+    'spgroup', 'spgroup_number',
+    'a', 'b', 'c', 'al', 'be', 'ga',
+    'esd_a', 'esd_b', 'esd_c', 'esd_al', 'esd_be', 'esd_ga',
+    'qi_1', 'qi_2', 'qi_3', 'ndim', 'ncomp',
+]
+COUNT_COLUMNS = ['n_main', 'n_satellite', 'n_points']
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    spgroup TEXT, spgroup_number INTEGER,
+    a REAL, b REAL, c REAL, al REAL, be REAL, ga REAL,
+    esd_a REAL, esd_b REAL, esd_c REAL, esd_al REAL, esd_be REAL, esd_ga REAL,
+    qi_1 REAL, qi_2 REAL, qi_3 REAL, ndim INTEGER, ncomp INTEGER,
+    n_main INTEGER, n_satellite INTEGER, n_points INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_files_directory ON files(directory);
+CREATE INDEX IF NOT EXISTS idx_files_kind_spgroup ON files(kind, spgroup);
+CREATE INDEX IF NOT EXISTS idx_files_kind_a ON files(kind, a);
+CREATE INDEX IF NOT EXISTS idx_files_kind_b ON files(kind, b);
+CREATE INDEX IF NOT EXISTS idx_files_kind_c ON files(kind, c);
+CREATE INDEX IF NOT EXISTS idx_files_kind_ndim ON files(kind, ndim);
+'''
+#}}}
+# _structure_row: {{{
+def _structure_row(m50_fn:str = None):
+    '''
+    Flattens the output of parse_m50_file into the structure columns of the catalog
+    '''
+    structure = parse_m50_file(m50_fn)
+    cell = structure.get('cell', {})
+    esd = structure.get('esdcell', {})
+    spgroup = structure.get('spgroup', {})
+    qi = structure.get('qi', (None, None, None))
+    return {
+        'spgroup': spgroup.get('symbol'),
+        'spgroup_number': spgroup.get('number'),
+        **{key: cell.get(key) for key in ['a', 'b', 'c', 'al', 'be', 'ga']},
+        **{key: esd.get(key) for key in ['esd_a', 'esd_b', 'esd_c', 'esd_al', 'esd_be', 'esd_ga']},
+        'qi_1': qi[0],
+        'qi_2': qi[1],
+        'qi_3': qi[2],
+        'ndim': structure.get('ndim'),
+        'ncomp': structure.get('ncomp'),
+    }
+#}}}
+# _count_prf_reflections: {{{
+def _count_prf_reflections(prf_fn:str = None, num_cols:int = 17):
+    '''
+    Counts the main and satellite reflections in a prf file without building the peak dictionaries
+    '''
+    n_main = 0
+    n_satellite = 0
+    with open(prf_fn) as f:
+        for line in f:
+            splitline = line.split()
+            if len(splitline) == num_cols:
+                try:
+                    m = int(splitline[3])
+                except ValueError:
+                    continue
+                if m == 0:
+                    n_main += 1
+                else:
+                    n_satellite += 1
+    return {'n_main': n_main, 'n_satellite': n_satellite}
+#}}}
+# _count_m90_points: {{{
+def _count_m90_points(m90_fn:str = None):
+    '''
+    Counts the data points in an m90 file (lines that start with a number)
+    '''
+    n_points = 0
+    with open(m90_fn) as f:
+        for line in f:
+            splitline = line.split()
+            if len(splitline) < 2:
+                continue
+            try:
+                float(splitline[0])
+                float(splitline[1])
+            except ValueError:
+                continue
+            n_points += 1
+    return {'n_points': n_points}
+#}}}
+# JANA_Catalog: {{{
+class JANA_Catalog:
+    '''
+    A local SQLite catalog of JANA project directories so that refinements can be found
+    by space group, cell, modulation vector, etc. without reparsing every directory.
+
+    Usage:
+        catalog = JANA_Catalog('jana_catalog.sqlite')
+        catalog.update(['/path/to/projects'])
+        for directory in catalog.query(spgroup = 'Pmnm(0b0)s00', b = (5.1, 5.2)):
+            tools = JANA_Tools(directory)
+    '''
+    # __init__: {{{
+    def __init__(self, db_path:str = 'jana_catalog.sqlite', num_cols:int = 17):
+        '''
+        db_path: the SQLite file to use. Made if it does not exist
+        num_cols: the number of columns of a reflection line in the prf files (17 for xrd, 13 for tof)
+        '''
+        self.db_path = db_path
+        self.num_cols = num_cols
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+    #}}}
+    # close: {{{
+    def close(self):
+        self.connection.close()
+    #}}}
+    # __enter__/__exit__: {{{
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+    #}}}
+    # _scan: {{{
+    def _scan(self, roots:list = None, recursive:bool = True):
+        '''
+        Yields the absolute path of every m50, prf, and m90 file in roots
+        '''
+        for root in roots:
+            for directory, subdirs, files in os.walk(root):
+                for fn in files:
+                    if fn.rsplit('.', 1)[-1] in CATALOG_EXTENSIONS:
+                        yield os.path.join(directory, fn)
+                if not recursive:
+                    break
+    #}}}
+    # _read_file: {{{
+    def _read_file(self, path:str = None, kind:str = None):
+        '''
+        Gets the catalog columns for one file
+        '''
+        if kind == 'm50':
+            return _structure_row(path)
+        elif kind == 'prf':
+            return _count_prf_reflections(path, self.num_cols)
+        elif kind == 'm90':
+            return _count_m90_points(path)
+        return {}
+    #}}}
+    # update: {{{
+    def update(self, roots:list = None, recursive:bool = True, verbose:bool = False):
+        '''
+        Adds new or changed files under roots to the catalog and removes files that no longer exist.
+        A file is only read again if its size or modification time has changed.
+
+        roots: a directory or list of directories to index
+        recursive: also index subdirectories
+
+        returns a dictionary with the number of files: added, updated, unchanged, removed, failed
+        '''
+        if isinstance(roots, str):
+            roots = [roots]
+        summary = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+        # Get the stored fingerprints under roots: {{{
+        roots = [os.path.abspath(root) for root in roots]
+        known = {}
+        for row in self.connection.execute('SELECT path, directory, size, mtime_ns FROM files'):
+            for root in roots:
+                if row['directory'] == root or (recursive and row['directory'].startswith(root + os.sep)):
+                    known[row['path']] = (row['size'], row['mtime_ns'])
+                    break
+        #}}}
+        seen = set()
+        with self.connection:
+            # Add or update files: {{{
+            for path in self._scan(roots, recursive):
+                seen.add(path)
+                stat = os.stat(path)
+                fingerprint = (stat.st_size, stat.st_mtime_ns)
+                if known.get(path) == fingerprint:
+                    summary['unchanged'] += 1
+                    continue
+                kind = path.rsplit('.', 1)[-1]
+                try:
+                    values = self._read_file(path, kind)
+                except Exception as e:
+                    summary['failed'] += 1
+                    if verbose:
+                        print(f'Could not read {path}: {e}')
+                    continue
+                row = {
+                    'path': path,
+                    'directory': os.path.dirname(path),
+                    'kind': kind,
+                    'size': fingerprint[0],
+                    'mtime_ns': fingerprint[1],
+                    **values,
+                }
+                columns = ', '.join(row.keys())
+                placeholders = ', '.join('?' for _ in row)
+                self.connection.execute(f'INSERT OR REPLACE INTO files ({columns}) VALUES ({placeholders})', tuple(row.values()))
+                summary['updated' if path in known else 'added'] += 1
+            #}}}
+            # Remove files that are gone: {{{
+            removed = [path for path in known if path not in seen]
+            self.connection.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+            summary['removed'] = len(removed)
+            #}}}
+        return summary
+    #}}}
+    # _where: {{{
+    def _where(self, conditions:dict = None):
+        '''
+        Turns keyword conditions into an SQL WHERE clause and parameters.
+
+        tuple: (min, max) inclusive. Either can be None
+        list: the value must be one of these
+        str containing %: SQL LIKE
+        anything else: equality
+        '''
+        clauses = []
+        params = []
+        for column, condition in conditions.items():
+            if column not in STRUCTURE_COLUMNS + COUNT_COLUMNS:
+                raise ValueError(f'Unknown column: {column}. Use one of: {STRUCTURE_COLUMNS + COUNT_COLUMNS}')
+            if isinstance(condition, tuple):
+                low, high = condition
+                if low is not None:
+                    clauses.append(f'{column} >= ?')
+                    params.append(low)
+                if high is not None:
+                    clauses.append(f'{column} <= ?')
+                    params.append(high)
+            elif isinstance(condition, (list, set)):
+                condition = list(condition)
+                clauses.append(f'{column} IN ({", ".join("?" for _ in condition)})')
+                params.extend(condition)
+            elif isinstance(condition, str) and '%' in condition:
+                clauses.append(f'{column} LIKE ?')
+                params.append(condition)
+            else:
+                clauses.append(f'{column} = ?')
+                params.append(condition)
+        return ' AND '.join(clauses), params
+    #}}}
+    # query_files: {{{
+    def query_files(self, kind:str = 'm50', **conditions):
+        '''
+        Returns the catalog rows (as dictionaries) of one kind of file (m50, prf, or m90)
+        that match every condition (see _where for the syntax).
+        '''
+        where, params = self._where(conditions)
+        sql = 'SELECT * FROM files WHERE kind = ?' + (f' AND {where}' if where else '') + ' ORDER BY path'
+        return [dict(row) for row in self.connection.execute(sql, [kind] + params)]
+    #}}}
+    # query: {{{
+    def query(self, **conditions):
+        '''
+        Returns a sorted list of project directories that can be given directly to JANA_Tools.
+
+        Structure conditions (spgroup, a, b, ndim, qi_2, ...) are matched against the m50 files
+        and count conditions (n_main, n_satellite) against the prf files, n_points against the m90 files.
+        A directory is returned if it has files matching all of them.
+
+        e.g. every refinement in a superspace group with b between 5.1 and 5.2 Å:
+            catalog.query(spgroup = 'Pmnm(0b0)s00', b = (5.1, 5.2))
+        '''
+        # Split the conditions by file type: {{{
+        by_kind = {}
+        for column, condition in conditions.items():
+            if column in ('n_main', 'n_satellite'):
+                kind = 'prf'
+            elif column == 'n_points':
+                kind = 'm90'
+            else:
+                kind = 'm50'
+            by_kind.setdefault(kind, {})[column] = condition
+        if not by_kind:
+            by_kind = {kind: {} for kind in CATALOG_EXTENSIONS}
+        #}}}
+        selects = []
+        params = []
+        operator = 'INTERSECT' if conditions else 'UNION'
+        for kind, kind_conditions in by_kind.items():
+            where, kind_params = self._where(kind_conditions)
+            selects.append('SELECT DISTINCT directory FROM files WHERE kind = ?' + (f' AND {where}' if where else ''))
+            params.extend([kind] + kind_params)
+        sql = f' {operator} '.join(selects) + ' ORDER BY directory'
+        return [row['directory'] for row in self.connection.execute(sql, params)]
+    #}}}
+#}}}
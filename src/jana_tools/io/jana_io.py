@@ -1,6 +1,7 @@
 # imports: {{{ 
 import os
 import pandas as pd
+from topas_tools.utils.topas_utils import is_number
 #}}}
 # export_dataframe: {{{
 def export_dataframe(df:pd.DataFrame = None, filename:str = None, filepath:str = None, sheet_name:str = 'Sheet1', overwrite:bool = False):
@@ -27,3 +28,87 @@ def export_dataframe(df:pd.DataFrame = None, filename:str = None, filepath:str =
     print(f'Your file was saved to: {os.path.join(filepath,filename)} in sheet: {sheet_name}')
     os.chdir(home)
 #}}}
+# parse_m50_file: {{{
+def parse_m50_file(m50_fn:str = None):
+    '''
+    This will parse the JANA m50 file for relevant information on the structure
+    and return it as a dictionary (cell, esdcell, ndim, qi, spgroup, symmetry, etc.)
+    '''
+    structure = {}
+    with open(m50_fn) as f:
+        previous_label = None # This stores the last first item in a row of the file. This tells what the row contains
+        lines = f.readlines()
+        # Parse the m50 file: {{{ 
+        for j, line in enumerate(lines):
+            splitline = line.split() # Get rid of whitespace convert to list
+            label = splitline[0]
+            if not is_number(label):
+                previous_label = label
+                # Cell: {{{
+                if label == 'cell' or label == 'esdcell':
+                    structure[label] = {}
+                    if label == 'cell':
+                        lst = ['a', 'b', 'c', 'al', 'be', 'ga']
+                    else:
+                        lst = ['esd_a', 'esd_b', 'esd_c', 'esd_al', 'esd_be', 'esd_ga']
+                    for k, lp in enumerate(lst):
+                        structure[label][lp] = float(splitline[k+1]) # we dont need to worry about the first item since its just the label
+                #}}}
+                # Ndim and Ncomp:{{{
+                if label == 'ndim':
+                    if len(splitline) == 4:
+                        structure[label] = int(splitline[1])
+                        structure[splitline[2]] = int(splitline[3])
+                    else:
+                        structure[label] = int(splitline[1])
+                     
+                #}}}
+                # qi and qr: {{{
+                if label == 'qi' or label == 'qr':
+                    structure[label] = (float(splitline[1]), float(splitline[2]), float(splitline[3]))
+                #}}}
+                # wmatrix: {{{
+                if label == 'wmatrix':
+                    structure[label] = []
+                #}}}
+                # spgroup: {{{
+                if label == 'spgroup':
+                    structure[label] = {'symbol':splitline[1]}
+                    try:
+                        structure[label]['number'] = int(splitline[2])
+                        structure[label]['num'] = int(splitline[3])
+                    except:
+                        pass
+                #}}}
+                #Centering: {{{
+                if label == 'lattice':
+                    structure[f'{label}_centering'] = splitline[1]
+                #}}}
+                #Lattice vectors: {{{
+                if label == 'lattvec':
+                    if label not in list(structure.keys()):
+                        structure[label] = []
+                    lattvec = []
+                    for k, v in enumerate(splitline):
+                        if k !=0:
+                            lattvec.append(float(v))
+                    structure[label].append(lattvec)
+                #}}}
+                #symmetry: {{{
+                if label == 'symmetry':
+                    if label not in list(structure.keys()):
+                        structure[label] = []
+                    symmop = []
+                    for k, v in enumerate(splitline):
+                        if k != 0:
+                            symmop.append(v)
+                    structure[label].append(symmop)
+                #}}}
+            # If you are looking at the wmatrix: {{{
+            else:
+                if previous_label == 'wmatrix':
+                    structure[previous_label].append([float(v) for v in splitline])
+            #}}}
+        #}}}
+    return structure
+#}}}
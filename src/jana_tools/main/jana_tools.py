@@ -4,22 +4,45 @@
 #}}}
 # imports: {{{ 
 import os
+import asyncio
+import threading
+import itertools
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from glob import glob
 import pandas as pd
 import numpy as np
-from topas_tools.utils.topas_utils import Utils, is_number
-from jana_tools.plotting.jana_plotting import JANA_Plot
+from topas_tools.utils.topas_utils import Utils
+from jana_tools.plotting.jana_plotting import JANA_Plot, write_pattern_report
+from jana_tools.analysis.jana_analysis import JANA_Analysis
 from jana_tools.io import jana_io
+from jana_tools.conv import units
 import re
+from plotly.offline import get_plotlyjs
+#}}}
+# Globals: {{{
+PROFILE_COLS = {'x': 0, 'yobs': 1, 'ycalc': 2, 'sigma': 3, 'background': 4} # Default columns of the calculated profile in a prf file
+_PARSE_COUNT = itertools.count() # Makes every parse of a prf file unique for hklm_fingerprint
 #}}}
 # JANA_Tools: {{{ 
-class JANA_Tools(Utils, JANA_Plot):
+class JANA_Tools(Utils, JANA_Plot, JANA_Analysis):
     # __init__: {{{ 
-    def __init__(self, hklm_dir:str = None):
+    def __init__(self, hklm_dir:str = None, composite_cache_size:int = 32):
+        '''
+        hklm_dir: the directory with your JANA files
+        composite_cache_size: the number of categorize_composite_hklm results to keep 
+                            (one per dataset, modulation axis, and parse of the prf file). 
+                            None keeps every result
+        '''
         Utils.__init__(self)
         JANA_Plot.__init__(self)
+        JANA_Analysis.__init__(self)
         # define internal variables: {{{
         self.jana_data = {} # This will store the relevant JANA data for you. 
+        self.composite_cache_size = composite_cache_size
+        self._composite_cache = OrderedDict() # {(index, modulation_axis, hklm_fingerprint): composite_hklm} in least to most recently used order
+        self._composite_lock = threading.Lock() # aiter_load parses on worker threads while categorize_composite_hklm may run on the event loop
         #}}}
         # Get hklm data from directory: {{{
         if hklm_dir == None or not os.path.isdir(hklm_dir):
@@ -47,6 +70,9 @@ class JANA_Tools(Utils, JANA_Plot):
         data_type: can be either xrd, tof, or npd
         num_cols: The number of columns for the first block of data in the prf file. Used for parsing.
         lambda_angstrom: This is the wavelength used for calcuating q
+
+        kwargs can also include the filters applied during parsing (see prf_file_parser): 
+            max_order, q_range, tth_range, min_fsq
         '''
         prf_files = glob(f'*.{fileextension}')     
         # collect and store the data: {{{
@@ -77,66 +103,277 @@ class JANA_Tools(Utils, JANA_Plot):
         files = glob(f'*.{fileextension}')
         # Loop through files: {{{
         for i, file in enumerate(files):
+            self.m90_file_parser(file, i)
+        #}}} 
+    #}}}
+    # m90_file_parser: {{{
+    def m90_file_parser(self, m90_fn:str = None, i:int = 0):
+        '''
+        This will parse a JANA m90 file for the header and the observed pattern.
+        '''
+        # set the jana_data dictionary: {{{ 
+        try:
+            self.jana_data[i].update({
+                'pattern':{
+                'header': {},
+                'tth':[],
+                'q': [],
+                'yobs':[],
+                'error':[],
+                }
+            })
+        except:
+            self.jana_data[i] = {
+                'pattern':{
+                'header': {},
+                'tth':[],
+                'q': [],
+                'yobs':[],
+                'error':[],
+                }
+            } 
+        #}}}
+        with open(m90_fn, 'r') as f:
+            lines = f.readlines()
+            for line in lines:
+                clean_line = self._clean_line(line)
+                last_entry = None # This is used to keep a record for updating the dictionary
+                # Loop through the entries in the cleaned line: {{{
+                for j, item in enumerate(clean_line):
+                    string, value = self._is_string(item) # string is a bool and value is either an int, string, or float
+                    if last_entry:
+                        self.jana_data[i]['pattern']['header'][last_entry] = value # Set the paired value
+                        last_entry = None
+                    if j%2 == 0:
+                        if string: 
+                            self.jana_data[i]['pattern']['header'][value] = None # Set up to record the paired value
+                            last_entry = value
+                    if not string:
+                        if j == 0:
+                            self.jana_data[i]['pattern']['tth'].append(value)
+                        if j == 1:
+                            self.jana_data[i]['pattern']['yobs'].append(value)
+                        if j == 2:
+                            self.jana_data[i]['pattern']['error'].append(value)
+                #}}}
+        # Convert tth to q in one step: {{{
+        lam = self.jana_data[i]['pattern']['header'].get('lambda')
+        if lam:
+            self.jana_data[i]['pattern']['q'] = units.tth_to_q(self.jana_data[i]['pattern']['tth'], lam)
+        #}}}
+    #}}}
+    # _load_file: {{{
+    def _load_file(self, kind:str = 'prf', fn:str = None, i:int = 0, **kwargs):
+        '''
+        Runs the correct parser for one file. 
+        kind is the file extension: prf, m90, or m50
+        kwargs are passed to prf_file_parser
+        '''
+        if kind == 'prf':
+            self.jana_data[i]['data_file'] = os.path.basename(fn)
+            self.prf_file_parser(fn, i, **kwargs)
+        elif kind == 'm90':
+            self.m90_file_parser(fn, i)
+        elif kind == 'm50':
+            self.jana_data[i]['m50_file'] = os.path.basename(fn)
+            self.m50_file_parser(fn, i)
+        else:
+            raise ValueError(f'Unknown file type: {kind}. Use prf, m90, or m50')
+    #}}}
+    # aiter_load: {{{
+    async def aiter_load(self,
+            kinds:list = ('prf', 'm90'),
+            modulated:bool = True,
+            data_type:str = 'xrd',
+            lambda_angstrom:float = 1.540593,
+            max_concurrency:int = 4,
+            executor = None,
+            **kwargs
+            ):
+        '''
+        Asynchronous counterpart to get_hklm_data, get_pattern_data, and get_lattice_information.
+        Each file is read and parsed in an executor so the event loop is never blocked. 
+        This is an async generator which yields a progress dictionary each time a file finishes:
+            {'kind', 'index', 'file', 'done', 'total'}
+
+        Usage: 
+            async for progress in tools.aiter_load(('prf', 'm90')):
+                ...
 
-            # set the jana_data dictionary: {{{ 
-            try:
-                self.jana_data[i].update({
-                    'pattern':{
-                    'header': {},
-                    'tth':[],
-                    'q': [],
-                    'yobs':[],
-                    'error':[],
-                    }
-                })
-            except:
-                self.jana_data[i] = {
-                    'pattern':{
-                    'header': {},
-                    'tth':[],
-                    'q': [],
-                    'yobs':[],
-                    'error':[],
-                    }
-                } 
+        kinds: the file extensions to load (prf, m90, m50). Indices match the synchronous loaders.
+        max_concurrency: the maximum number of files being parsed at once
+        executor: a ThreadPoolExecutor to use. If None, the event loop's default thread pool is used.
+                The parsers store their results in self.jana_data, so they must run in this process.
+                A ProcessPoolExecutor would parse into a copy of self in the worker and 
+                the results would be lost, so anything other than a thread pool raises a ValueError.
+        kwargs: passed to prf_file_parser (e.g. num_cols)
 
+        Files are located with absolute paths in self.hklm_dir so the working directory 
+        is never changed. If the generator is closed or its task cancelled, 
+        files which have not started are never parsed.
+        '''
+        if executor is not None and not isinstance(executor, ThreadPoolExecutor):
+            raise ValueError(f'aiter_load needs a ThreadPoolExecutor (the parsers fill self.jana_data in place). Not: {type(executor).__name__}')
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        prf_kwargs = dict(modulated = modulated, data_type = data_type, lambda_angstrom = lambda_angstrom, **kwargs)
+        # Find the files: {{{
+        jobs = []
+        for kind in kinds:
+            files = glob(os.path.join(self.hklm_dir, f'*.{kind}'))
+            for i, fn in enumerate(files):
+                self.jana_data.setdefault(i, {}) # Made here so parsers never race to create the entry
+                jobs.append((kind, i, fn))
         #}}}
-            with open(file, 'r') as f:
-                lines = f.readlines()
-                for line in lines:
-                    clean_line = self._clean_line(line)
-                    last_entry = None # This is used to keep a record for updating the dictionary
-                    # Loop through the entries in the cleaned line: {{{
-                    for j, item in enumerate(clean_line):
-                        string, value = self._is_string(item) # string is a bool and value is either an int, string, or float
-                        if last_entry:
-                            self.jana_data[i]['pattern']['header'][last_entry] = value # Set the paired value
-                            last_entry = None
-                        if j%2 == 0:
-                            if string: 
-                                self.jana_data[i]['pattern']['header'][value] = None # Set up to record the paired value
-                                last_entry = value
-                        if not string:
-                            if j == 0:
-                                self.jana_data[i]['pattern']['tth'].append(value)
-                                # Try to convert tth to q: {{{
-                                try:
-                                    lam = self.jana_data[i]['pattern']['header']['lambda']
-                                    q = self.convert_to_q(value, lam)
-                                    self.jana_data[i]['pattern']['q'].append(q)
-                                except:
-                                    pass
-                                #}}}
-                            if j == 1:
-                                self.jana_data[i]['pattern']['yobs'].append(value)
-                            if j == 2:
-                                self.jana_data[i]['pattern']['error'].append(value)
-                    #}}}
-                    
+        # _run: {{{
+        async def _run(kind, i, fn):
+            async with semaphore:
+                if kind == 'prf':
+                    job = partial(self._load_file, kind, fn, i, **prf_kwargs)
+                else:
+                    job = partial(self._load_file, kind, fn, i)
+                await loop.run_in_executor(executor, job)
+            return kind, i, fn
+        #}}}
+        tasks = [asyncio.ensure_future(_run(*job)) for job in jobs]
+        try:
+            for done, future in enumerate(asyncio.as_completed(tasks), start = 1):
+                kind, i, fn = await future
+                yield {'kind': kind, 'index': i, 'file': fn, 'done': done, 'total': len(tasks)}
+        finally:
+            # Cancel anything that has not finished: {{{
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+            #}}}
+    #}}}
+    # aload: {{{
+    async def aload(self,
+            kinds:list = ('prf', 'm90'),
+            progress = None,
+            **kwargs
+            ):
+        '''
+        Awaitable version of the loaders: 
+            await tools.aload(('prf', 'm90', 'm50'))
 
+        progress: an optional callable (or coroutine function) called with the 
+                progress dictionary from aiter_load after each file
+        kwargs: passed to aiter_load
 
-        #}}} 
-        
+        returns jana_data
+        '''
+        async for update in self.aiter_load(kinds, **kwargs):
+            if progress is not None:
+                result = progress(update)
+                if asyncio.iscoroutine(result):
+                    await result
+        return self.jana_data
+    #}}}
+    # render_reports: {{{
+    def render_reports(self,
+            indices:list = None,
+            outdir:str = 'reports',
+            composite:bool = False,
+            plot_vs_q:bool = False,
+            modulation_axis:str = 'b',
+            max_workers:int = None,
+            **kwargs
+            ):
+        '''
+        Writes a standalone html page of the pattern with hkl ticks for each dataset
+        (the same plot as plot_pattern_with_hkl). The figures are built and written 
+        in a process pool without being shown. 
+        plotly.min.js is written to outdir once and shared by every page.
+
+        indices: the jana_data indices to make reports for. If None, every dataset is used
+        outdir: the directory to write the reports to. Made if it does not exist
+        composite: use the composite categories for the ticks
+        plot_vs_q: plot on a q scale rather than 2theta
+        modulation_axis: used for categorize_composite_hklm when composite is True
+        max_workers: number of processes. 1 writes the reports in this process
+        kwargs: passed to build_pattern_figure (e.g. hkl_offset, show_calc, show_diff, clustered)
+
+        returns a list of the files written
+        '''
+        if indices is None:
+            indices = list(self.jana_data.keys())
+        outdir = os.path.abspath(outdir)
+        os.makedirs(outdir, exist_ok = True)
+        # Write the plotly library once: {{{
+        plotlyjs_fn = os.path.join(outdir, 'plotly.min.js')
+        if not os.path.exists(plotlyjs_fn):
+            with open(plotlyjs_fn, 'w', encoding = 'utf-8') as f:
+                f.write(get_plotlyjs())
+        #}}}
+        # Make the jobs: {{{
+        jobs = []
+        for idx in indices:
+            if composite:
+                self.categorize_composite_hklm(idx, modulation_axis) # Cached, so this only recomputes if the hklm_data or axis changed
+            data_file = self.jana_data[idx].get('data_file')
+            basename = os.path.splitext(data_file)[0] if data_file else f'dataset_{idx}'
+            figure_kwargs = dict(plot_vs_q = plot_vs_q, composite = composite, title = basename, **kwargs)
+            jobs.append((self._report_payload(idx, composite), os.path.join(outdir, f'{basename}.html'), figure_kwargs))
+        #}}}
+        # Write the reports: {{{
+        if max_workers == 1:
+            return [write_pattern_report(job) for job in jobs]
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            return list(executor.map(write_pattern_report, jobs, chunksize = max(1, len(jobs)//32)))
+        #}}}
+    #}}}
+    # _report_payload: {{{
+    def _report_payload(self, idx:int = 0, composite:bool = False):
+        '''
+        Returns only the arrays needed to plot a dataset so that
+        the peak dictionaries are not sent to the worker processes.
+        '''
+        dataset = self.jana_data[idx]
+        keep = ('tth', 'q', 'ht', 'hovertemplate')
+        payload = {}
+        for key in ('pattern', 'profile'):
+            if key in dataset:
+                payload[key] = {k: v for k, v in dataset[key].items() if k != 'header'}
+        source = 'composite_hklm' if composite else 'hklm_data'
+        payload[source] = {
+            classification: {k: v for k, v in entry.items() if k in keep}
+            for classification, entry in dataset[source].items()
+        }
+        if 'hklm_clusters' in dataset:
+            payload['hklm_clusters'] = dataset['hklm_clusters'][['tth', 'q', 'kind', 'ht']]
+        return payload
+    #}}}
+    # convert_units: {{{
+    def convert_units(self,
+            to_units:list = ('q', 'd', 's'),
+            from_unit:str = 'tth',
+            indices:list = None,
+            lambda_angstrom = None,
+            difc = None,
+            difa = 0.0,
+            zero = 0.0,
+            ):
+        '''
+        Converts the pattern and hklm x values of every dataset in jana_data (or those in indices)
+        from from_unit into each of to_units in one vectorized step per dataset. 
+        The results are stored alongside the existing arrays (e.g. jana_data[i]['pattern']['d'])
+
+        to_units: any of: tth, q, d, s, tof
+        from_unit: the key of the x values you already have (usually tth or tof)
+        lambda_angstrom: single value or {index: wavelength}. If None, uses the lambda from the .m90 header
+        difc, difa, zero: TOF calibration constants. single value or {index: value}
+        '''
+        return units.convert_jana_data(
+            self.jana_data,
+            to_units = to_units,
+            from_unit = from_unit,
+            indices = indices,
+            lambda_angstrom = lambda_angstrom,
+            difc = difc,
+            difa = difa,
+            zero = zero,
+        )
     #}}}
     # prf_file_parser: {{{
     def prf_file_parser(self, 
@@ -146,6 +383,10 @@ class JANA_Tools(Utils, JANA_Plot):
             data_type:str = 'xrd',
             #num_cols:int = 17,
             lambda_angstrom:float = 1.540593,
+            max_order:int = None,
+            q_range:tuple = None,
+            tth_range:tuple = None,
+            min_fsq:float = None,
             **kwargs
             ):
         '''
@@ -158,6 +399,23 @@ class JANA_Tools(Utils, JANA_Plot):
         num_cols: Length of columns in the prf file
         lambda_angstrom: This is used to convert the 2theta into q for direct comparison
                         with other data
+
+        The filters below are applied before the peak dictionaries are made so rejected reflections are never stored.
+        max_order, min_fsq, and (for xrd) the windows are checked while each line is read.
+        For tof, the windows are checked once the whole reflection list has been converted
+        since 2theta and q are derived from d:
+        max_order: only keep reflections with |m| <= max_order
+        q_range: (min, max) q to keep. Either can be None
+        tth_range: (min, max) 2theta to keep. Either can be None
+        min_fsq: only keep reflections with fsq >= min_fsq
+
+        The calculated profile block is read in the same pass and stored in jana_data[idx]['profile']
+        with: tth (or tof), q, yobs, ycalc, background, sigma, difference
+        profile_cols: (kwarg) dictionary giving the column of each of: x, yobs, ycalc, sigma, background
+                    default: {'x': 0, 'yobs': 1, 'ycalc': 2, 'sigma': 3, 'background': 4}
+
+        jana_data[idx]['hklm_fingerprint'] changes every time the file is parsed 
+        so that results computed from the hklm data can tell when they are out of date.
         '''
         
         data_type = data_type.lower() # makes it invariant of case
@@ -167,6 +425,8 @@ class JANA_Tools(Utils, JANA_Plot):
             num_cols = 13
         if isinstance(kwargs.get('num_cols'), int):
             num_cols = kwargs.get('num_cols')
+        self._clear_composite_cache(idx) # Any categorization of the old hklm_data is out of date
+        self.jana_data.get(idx, {}).pop('composite_hklm', None)
         # Initialize vars: {{{ 
         try:
             self.jana_data[idx].update({
@@ -182,19 +442,12 @@ class JANA_Tools(Utils, JANA_Plot):
                     'satellite': {'peaks': {}},
                 },
             }
-        main_q = []
-        main_tth = []
-        main_tof = [] # Hold TOFs if using TOF neutrons
-        main_ht = [] # holds strings for hover templates for main reflections
-        
-        
-        satellite_q = []
-        satellite_tth = []
-        satellite_tof = []  # holds TOFs if using TOF neutrons
-        satellite_ht = [] # holds strings for hover templates for satellite reflections
+        reflections = [] # holds (h, k, l, m, fsq, fwhm, tth or d, tof) for each reflection kept while reading
+        if data_type == 'xrd':
+            tth_low, tth_high = self._tth_window(tth_range, q_range, lambda_angstrom) # q rises with 2theta so both windows are one 2theta window
 
-        main_peaks = 0
-        satellite_peaks = 0
+        profile_cols = kwargs.get('profile_cols', PROFILE_COLS)
+        profile_rows = [] # holds the lines of the calculated profile
         #}}}
 
         with open(prf_fn) as f:
@@ -206,197 +459,122 @@ class JANA_Tools(Utils, JANA_Plot):
                 if len(clean_line) == num_cols:
                     # Modulated case: {{{
                     if modulated:
+                        m = int(clean_line[3])
+                        if max_order is not None and abs(m) > max_order:
+                            continue
                         h = int(clean_line[0])
                         k = int(clean_line[1])
                         l = int(clean_line[2])
-                        m = int(clean_line[3])
-                        hklm = f'{h} {k} {l} {m}'
                         # Handle the XRD Case: {{{
                         if data_type == 'xrd':
                             fsq = float(clean_line[8])
+                            if min_fsq is not None and fsq < min_fsq:
+                                continue
                             fwhm = float(clean_line[9])
-                            tth = float(clean_line[10])
-
-                            d = lambda_angstrom / (2* np.sin(np.pi/180*tth)) # Get d spacing in angstrom
-                            q = self.convert_to_q(tth = tth, lambda_angstrom=lambda_angstrom)
-                            s = self.convert_to_s(d)
+                            x = float(clean_line[10]) # 2theta
+                            if (tth_low is not None and not x >= tth_low) or (tth_high is not None and not x <= tth_high):
+                                continue # "not" so that nan is rejected too
+                            tof = None
                         #}}}
                         # Handle the TOF Neutron Case: {{{
                         elif data_type == 'tof':
-                            tof = float(clean_line[6])
                             fsq = float(clean_line[9])
+                            if min_fsq is not None and fsq < min_fsq:
+                                continue
+                            tof = float(clean_line[6])
                             fwhm = None # Do not know if this is output
-                            d = float(clean_line[10])
-                            tth = self.calc_tth_from_d(lam = lambda_angstrom, d = d) # Gives an estimate of the 2theta value for the peak
-                            q = self.convert_to_q(tth = tth, lambda_angstrom = lambda_angstrom)
-                            s = self.convert_to_s(d)
-                        #}}}
-                        
-
-                        hklm_ht = '{}<br>hklm: ({})<br>d-spacing: {} {}<br>FSQ: {}<br>FWHM: {}' # format: type, hklm, d-spacing, fsq, fwhm
-                        # Handle m=0: {{{
-                        if m == 0: 
-                            self.jana_data[idx]['hklm_data']['main']['peaks'][main_peaks] = {
-                                'hklm': hklm,
-                                'h': h,
-                                'k': k,
-                                'l': l,
-                                'm': m,
-                                'tth': tth,
-                                'q': q,
-                                's': s,
-                                'd-spacing': d,
-                                'fsq': fsq,
-                                'fwhm': fwhm,
-
-                            }
-                            if data_type == 'tof':
-                                self.jana_data[idx]['hklm_data']['main']['peaks'][main_peaks].update({
-                                    'tof': tof,
-                                })
-                                main_tof.append(tof)
-                            intermediate_hklm_ht = hklm_ht.format('main', hklm, np.around(d,4), self._angstrom, fsq, fwhm)
-                            final_hklm_ht = intermediate_hklm_ht+f'<br>tth: {np.around(tth,4)}<br>q: {np.around(q,4)}'
-                            main_peaks += 1
-                            main_q.append(q)
-                            main_tth.append(tth)
-                            main_ht.append(final_hklm_ht)
-                        #}}} 
-                        # m != 0: {{{
-                        elif np.abs(m) > 0: 
-                            self.jana_data[idx]['hklm_data']['satellite']['peaks'][satellite_peaks] = {
-                                'hklm': hklm, 
-                                'h': h,
-                                'k': k,
-                                'l': l,
-                                'm': m,
-                                'tth': tth,
-                                'q': q,
-                                's': s,
-                                'd-spacing': d,
-                                'fsq': fsq,
-                                'fwhm': fwhm,
-
-                            }
-                            if data_type == 'tof':
-                                self.jana_data[idx]['hklm_data']['satellite']['peaks'][satellite_peaks].update({
-                                    'tof': tof,
-                                }) 
-                                satellite_tof.append(tof)
-                            intermediate_hklm_ht = hklm_ht.format('satellite', hklm, np.around(d,4), self._angstrom, fsq, fwhm)
-                            final_hklm_ht = intermediate_hklm_ht+f'<br>tth: {np.around(tth,4)}<br>q: {np.around(q,4)}'
-                            satellite_peaks+= 1
-                            satellite_q.append(q)
-                            satellite_tth.append(tth)
-                            satellite_ht.append(final_hklm_ht)
+                            x = float(clean_line[10]) # d-spacing
                         #}}}
-                        
+                        reflections.append((h, k, l, m, fsq, fwhm, x, tof))
                     #}}} 
                     # Alternate case: {{{
                     else: 
                         print(f'You have elected to use the non-modulated case.\n'+
                         'This feature is not available yet.')
                     #}}}
-            # Add tth and q arrays: {{{
-            # Main reflections: {{{
-            self.jana_data[idx]['hklm_data']['main']['tth'] = np.array(main_tth)
-            self.jana_data[idx]['hklm_data']['main']['q'] = np.array(main_q)
-            self.jana_data[idx]['hklm_data']['main']['hovertemplate'] = main_ht
+                # Calculated profile: {{{
+                else:
+                    profile_row = self._parse_profile_line(clean_line, profile_cols)
+                    if profile_row:
+                        profile_rows.append(profile_row)
+                #}}}
+        # Convert every reflection at once: {{{
+        x = np.array([reflection[6] for reflection in reflections], dtype = float)
+        if data_type == 'xrd':
+            tth = x
+            d = units.tth_to_d(tth, lambda_angstrom) # Get d spacing in angstrom
+            q = units.tth_to_q(tth, lambda_angstrom)
+        elif data_type == 'tof':
+            d = x
+            tth = units.d_to_tth(d, lambda_angstrom) # Gives an estimate of the 2theta value for the peak
+            q = units.d_to_q(d)
+        s = units.d_to_s(d)
+        #}}}
+        # Reject TOF reflections outside of the windows requested: {{{
+        if data_type == 'tof':
+            keep = np.flatnonzero(self._in_range(tth, tth_range) & self._in_range(q, q_range))
+        else:
+            keep = np.arange(len(x))
+        #}}}
+        # Build the peak dictionaries: {{{
+        tth, q, s, d = tth.tolist(), q.tolist(), s.tolist(), d.tolist()
+        hklm_ht = '{}<br>hklm: ({})<br>d-spacing: {} {}<br>FSQ: {}<br>FWHM: {}<br>tth: {}<br>q: {}' # format: type, hklm, d-spacing, fsq, fwhm, tth, q
+        ht_d, ht_tth, ht_q = (np.around(values, 4).tolist() for values in (d, tth, q))
+        blocks = {
+            'main': {'peaks': self.jana_data[idx]['hklm_data']['main']['peaks'], 'tth': [], 'q': [], 'tof': [], 'hovertemplate': []},
+            'satellite': {'peaks': self.jana_data[idx]['hklm_data']['satellite']['peaks'], 'tth': [], 'q': [], 'tof': [], 'hovertemplate': []},
+        }
+        for i in keep.tolist():
+            h, k, l, m, fsq, fwhm, _, tof = reflections[i]
+            hklm = f'{h} {k} {l} {m}'
+            kind = 'main' if m == 0 else 'satellite'
+            block = blocks[kind]
+            peak = {
+                'hklm': hklm,
+                'h': h,
+                'k': k,
+                'l': l,
+                'm': m,
+                'tth': tth[i],
+                'q': q[i],
+                's': s[i],
+                'd-spacing': d[i],
+                'fsq': fsq,
+                'fwhm': fwhm,
+            }
             if data_type == 'tof':
-                self.jana_data[idx]['hklm_data']['main']['tof'] = np.array(main_tof)
-
-            #}}}
-            # Modulation Reflections: {{{
-            if modulated:
-                self.jana_data[idx]['hklm_data']['satellite']['tth'] = np.array(satellite_tth)
-                self.jana_data[idx]['hklm_data']['satellite']['q'] = np.array(satellite_q)
-                self.jana_data[idx]['hklm_data']['satellite']['hovertemplate'] = satellite_ht
-                if data_type == 'tof':
-                    self.jana_data[idx]['hklm_data']['satellite']['tof'] = np.array(satellite_tof)
-            #}}}
-            #}}} 
+                peak['tof'] = tof
+                block['tof'].append(tof)
+            block['peaks'][len(block['peaks'])] = peak
+            block['tth'].append(tth[i])
+            block['q'].append(q[i])
+            block['hovertemplate'].append(hklm_ht.format(kind, hklm, ht_d[i], self._angstrom, fsq, fwhm, ht_tth[i], ht_q[i]))
+        #}}}
+        # Record which parse produced this hklm_data: {{{
+        stat = os.stat(prf_fn)
+        self.jana_data[idx]['hklm_fingerprint'] = (os.path.basename(prf_fn), stat.st_mtime_ns, stat.st_size, next(_PARSE_COUNT))
+        #}}}
+        # Add the profile: {{{
+        if profile_rows:
+            self.jana_data[idx]['profile'] = self._make_profile(profile_rows, data_type, lambda_angstrom)
+        #}}}
+        # Add tth and q arrays: {{{
+        for kind, block in blocks.items():
+            if kind == 'satellite' and not modulated:
+                continue
+            self.jana_data[idx]['hklm_data'][kind]['tth'] = np.array(block['tth'])
+            self.jana_data[idx]['hklm_data'][kind]['q'] = np.array(block['q'])
+            self.jana_data[idx]['hklm_data'][kind]['hovertemplate'] = block['hovertemplate']
+            if data_type == 'tof':
+                self.jana_data[idx]['hklm_data'][kind]['tof'] = np.array(block['tof'])
+        #}}} 
     #}}}
     # m50_file_parser: {{{
     def m50_file_parser(self,m50_fn:str = None, i:int = 0):
         '''
         This will parse the JANA m50 file for relevant information on the structure.
         '''
-        self.jana_data[i]['structure'] = {}
-        with open(m50_fn) as f:
-            previous_label = None # This stores the last first item in a row of the file. This tells what the row contains
-            lines = f.readlines()
-            # Parse the m50 file: {{{ 
-            for j, line in enumerate(lines):
-                splitline = line.split() # Get rid of whitespace convert to list
-                label = splitline[0]
-                if not is_number(label):
-                    previous_label = label
-                    # Cell: {{{
-                    if label == 'cell' or label == 'esdcell':
-                        self.jana_data[i]['structure'][label] = {}
-                        if label == 'cell':
-                            lst = ['a', 'b', 'c', 'al', 'be', 'ga']
-                        else:
-                            lst = ['esd_a', 'esd_b', 'esd_c', 'esd_al', 'esd_be', 'esd_ga']
-                        for k, lp in enumerate(lst):
-                            self.jana_data[i]['structure'][label][lp] = float(splitline[k+1]) # we dont need to worry about the first item since its just the label
-                    #}}}
-                    # Ndim and Ncomp:{{{
-                    if label == 'ndim':
-                        if len(splitline) == 4:
-                            self.jana_data[i]['structure'][label] = int(splitline[1])
-                            self.jana_data[i]['structure'][splitline[2]] = int(splitline[3])
-                        else:
-                            self.jana_data[i]['structure'][label] = int(splitline[1])
-                         
-                    #}}}
-                    # qi and qr: {{{
-                    if label == 'qi' or label == 'qr':
-                        self.jana_data[i]['structure'][label] = (float(splitline[1]), float(splitline[2]), float(splitline[3]))
-                    #}}}
-                    # wmatrix: {{{
-                    if label == 'wmatrix':
-                        self.jana_data[i]['structure'][label] = []
-                    #}}}
-                    # spgroup: {{{
-                    if label == 'spgroup':
-                        self.jana_data[i]['structure'][label] = {'symbol':splitline[1]}
-                        try:
-                            self.jana_data[i]['structure'][label]['number'] = int(splitline[2])
-                            self.jana_data[i]['structure'][label]['num'] = int(splitline[3])
-                        except:
-                            pass
-                    #}}}
-                    #Centering: {{{
-                    if label == 'lattice':
-                        self.jana_data[i]['structure'][f'{label}_centering'] = splitline[1]
-                    #}}}
-                    #Lattice vectors: {{{
-                    if label == 'lattvec':
-                        if label not in list(self.jana_data[i]['structure'].keys()):
-                            self.jana_data[i]['structure'][label] = []
-                        lattvec = []
-                        for k, v in enumerate(splitline):
-                            if k !=0:
-                                lattvec.append(float(v))
-                        self.jana_data[i]['structure'][label].append(lattvec)
-                    #}}}
-                    #symmetry: {{{
-                    if label == 'symmetry':
-                        if label not in list(self.jana_data[i]['structure'].keys()):
-                            self.jana_data[i]['structure'][label] = []
-                        symmop = []
-                        for k, v in enumerate(splitline):
-                            if k != 0:
-                                symmop.append(v)
-                        self.jana_data[i]['structure'][label].append(symmop)
-                    #}}}
-                # If you are looking at the wmatrix: {{{
-                else:
-                    if previous_label == 'wmatrix':
-                        self.jana_data[i]['structure'][previous_label].append([float(v) for v in splitline])
-                #}}}
-            #}}}                
+        self.jana_data[i]['structure'] = jana_io.parse_m50_file(m50_fn)
     #}}}
     # categorize_composite_hklm: {{{ 
     def categorize_composite_hklm(self,index:int = 0,  modulation_axis:str = 'b'):
@@ -406,7 +584,21 @@ class JANA_Tools(Utils, JANA_Plot):
         the primary, secondary, common, and satellite indices for you.
 
         index: This is the index of the hklm dictionary data you want
+
+        Results are cached for each (index, modulation_axis) until the prf file is parsed again
+        so switching between axes does not recompute anything. 
+        The result is set as jana_data[index]['composite_hklm'] and returned.
         '''
+        # Check the cache: {{{
+        key = (index, modulation_axis, self.jana_data[index].get('hklm_fingerprint'))
+        with self._composite_lock:
+            cached = self._composite_cache.get(key)
+            if cached is not None:
+                self._composite_cache.move_to_end(key)
+        if cached is not None:
+            self.jana_data[index]['composite_hklm'] = cached
+            return cached
+        #}}}
         # Common axis setup: {{{
         common_h, common_k, common_l = (None, None, None)
         if modulation_axis == 'a':
@@ -527,15 +719,34 @@ class JANA_Tools(Utils, JANA_Plot):
                 'satellites': satellites,
         }
         #}}}
+        # Update the cache: {{{
+        with self._composite_lock:
+            self._composite_cache[key] = self.jana_data[index]['composite_hklm']
+            if self.composite_cache_size is not None:
+                while len(self._composite_cache) > self.composite_cache_size:
+                    self._composite_cache.popitem(last = False) # Drop the least recently used
+        #}}}
+        return self.jana_data[index]['composite_hklm']
+    #}}}
+    # _clear_composite_cache: {{{
+    def _clear_composite_cache(self, index:int = None):
+        '''
+        Removes the cached categorize_composite_hklm results for one dataset (or all if index is None)
+        '''
+        with self._composite_lock:
+            for key in list(self._composite_cache.keys()):
+                if index is None or key[0] == index:
+                    self._composite_cache.pop(key, None)
     #}}}
     # make_peak_dataframes: {{{
-    def make_peak_dataframes(self, idx:int = 0, composite:bool = False, export:bool = False, **kwargs):
+    def make_peak_dataframes(self, idx:int = 0, composite:bool = False, export:bool = False, modulation_axis:str = None, **kwargs):
         '''
         This function creates dataframes that contain the h, k, l, m indices of each peak and includes all the relevant information 
         for each peak in the diffraction pattern
 
         idx: This is the index of the data file in the jana_data dictionary
         composite: This tells the function whether to output only main and satellite dataframes or main, secondary, common, and satellite dataframes
+        modulation_axis: if given with composite, categorize_composite_hklm is run for this axis first (cached after the first time)
 
         composite output: 
             (
@@ -559,6 +770,8 @@ class JANA_Tools(Utils, JANA_Plot):
         #}}}
         # Choose your working dictionary: {{{
         if composite:
+            if modulation_axis is not None:
+                self.categorize_composite_hklm(idx, modulation_axis)
             base =  self.jana_data[idx]['composite_hklm']
             working_dicts = [
                 base['primary']['peaks'],
@@ -642,6 +855,82 @@ class JANA_Tools(Utils, JANA_Plot):
         #}}} 
         return (primary_ht, secondary_ht, common_ht, satellite_ht)
     #}}}
+    # _parse_profile_line: {{{
+    def _parse_profile_line(self, clean_line:list = None, profile_cols:dict = None):
+        '''
+        Lines of the calculated profile are all floats (the first column always has a decimal point), 
+        which separates them from reflection lines and the integer only lines that separate blocks in the prf file.
+
+        returns a tuple of the values in the order of PROFILE_COLS or None if the line is not part of the profile.
+        '''
+        if len(clean_line) <= max(profile_cols.values()) or '.' not in clean_line[0]:
+            return None
+        try:
+            return tuple(float(clean_line[profile_cols[key]]) for key in PROFILE_COLS)
+        except ValueError:
+            return None
+    #}}}
+    # _make_profile: {{{
+    def _make_profile(self, profile_rows:list = None, data_type:str = 'xrd', lambda_angstrom:float = 1.540593):
+        '''
+        Turns the rows of the calculated profile into arrays
+        '''
+        x, yobs, ycalc, sigma, background = np.array(profile_rows, dtype = float).T
+        profile = {
+            'yobs': yobs,
+            'ycalc': ycalc,
+            'background': background,
+            'sigma': sigma,
+            'difference': yobs - ycalc,
+        }
+        if data_type == 'tof':
+            profile['tof'] = x
+        else:
+            profile['tth'] = x
+            profile['q'] = units.tth_to_q(x, lambda_angstrom)
+        return profile
+    #}}}
+    # _tth_window: {{{
+    def _tth_window(self, tth_range:tuple = None, q_range:tuple = None, lambda_angstrom:float = 1.540593):
+        '''
+        Combines a 2theta window and a q window into one (min, max) 2theta window.
+        Either end is None if it is open. 
+        A q minimum that the wavelength cannot reach rejects everything, a q maximum that it cannot reach is open.
+        '''
+        low, high = tth_range if tth_range is not None else (None, None)
+        if q_range is not None:
+            q_low, q_high = q_range
+            if q_low is not None:
+                tth = float(units.q_to_tth(q_low, lambda_angstrom))
+                tth = np.inf if np.isnan(tth) else tth
+                low = tth if low is None else max(low, tth)
+            if q_high is not None:
+                tth = float(units.q_to_tth(q_high, lambda_angstrom))
+                if not np.isnan(tth):
+                    high = tth if high is None else min(high, tth)
+        return low, high
+    #}}}
+    # _in_range: {{{
+    def _in_range(self, values:np.ndarray = None, value_range:tuple = None):
+        '''
+        Returns a boolean array: True where values are inside of value_range (min, max). 
+        If value_range is None or either end is None, that side is open.
+        Non-finite values (e.g. the nan 2theta of a TOF reflection the wavelength cannot reach)
+        are outside of any window that is set.
+        '''
+        values = np.asarray(values, dtype = float)
+        mask = np.ones(values.shape, dtype = bool)
+        if value_range is None:
+            return mask
+        low, high = value_range
+        if low is not None or high is not None:
+            mask &= np.isfinite(values)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+    #}}}
     # _clean_line{{{ 
     def _clean_line(self, line):
         '''
@@ -8,6 +8,143 @@ from topas_tools.utils.topas_utils import Utils, UsefulUnicode
 import re
 import os
 import numpy as np
+import plotly.graph_objects as go
+#}}}
+# Globals: {{{
+COMPOSITE_HKL_NAMES = ['primary', 'secondary', 'common', 'satellites']
+COMPOSITE_HKL_COLORS = ['blue', 'green', 'purple', 'orange']
+CLUSTER_KINDS = ['main', 'satellite', 'mixed']
+CLUSTER_COLORS = ['blue', 'orange', 'purple']
+#}}}
+# get_hkl_dictionaries: {{{
+def get_hkl_dictionaries(dataset:dict = None, composite:bool = False):
+    '''
+    Returns the list of hkl dictionaries to plot for one jana_data entry.
+    composite: (primary, secondary, common, satellites) otherwise (main, satellite)
+    '''
+    if composite:
+        composite_dicts = dataset['composite_hklm']
+        return [
+            composite_dicts['primary'], 
+            composite_dicts['secondary'],
+            composite_dicts['common'],
+            composite_dicts['satellites'],
+        ]
+    hklm_data = dataset['hklm_data']
+    return [hklm_data['main'], hklm_data['satellite']]
+#}}}
+# get_cluster_dictionaries: {{{
+def get_cluster_dictionaries(dataset:dict = None):
+    '''
+    Splits the clusters made by cluster_hklm into main, satellite, and mixed
+    dictionaries shaped like the hkl dictionaries so they can be plotted the same way.
+    '''
+    clusters = dataset['hklm_clusters']
+    dictionaries = []
+    for kind in CLUSTER_KINDS:
+        subset = clusters[clusters['kind'] == kind]
+        dictionaries.append({
+            'tth': subset['tth'].to_numpy(),
+            'q': subset['q'].to_numpy(),
+            'ht': subset['ht'].tolist(),
+        })
+    return dictionaries
+#}}}
+# get_hkl_traces: {{{
+def get_hkl_traces(dataset:dict = None, composite:bool = False, clustered:bool = False, hkl_names:list = None, hkl_colors:list = None):
+    '''
+    Returns (dictionaries, names, colors) for the hkl ticks of one jana_data entry
+    so that build_pattern_figure and JANA_Plot.plot_pattern_with_hkl plot the same thing.
+    If hkl_names or hkl_colors is None, the defaults for main/satellites (or the composite categories) are used.
+    '''
+    if clustered:
+        return get_cluster_dictionaries(dataset), [f'{kind} clusters' for kind in CLUSTER_KINDS], CLUSTER_COLORS
+    if hkl_names is None:
+        hkl_names = COMPOSITE_HKL_NAMES if composite else ['main', 'satellites']
+    if hkl_colors is None:
+        hkl_colors = COMPOSITE_HKL_COLORS if composite else ['blue', 'orange']
+    return get_hkl_dictionaries(dataset, composite), hkl_names, hkl_colors
+#}}}
+# build_pattern_figure: {{{
+def build_pattern_figure(
+        dataset:dict = None,
+        plot_vs_q:bool = False,
+        composite:bool = False,
+        hkl_offset:int = -1800,
+        hkl_names:list = None,
+        hkl_colors:list = None,
+        height:int = 650,
+        width:int = 1000,
+        marker_size:int = 8,
+        show_calc:bool = False,
+        show_diff:bool = False,
+        diff_offset:float = None,
+        clustered:bool = False,
+        title:str = None,
+        xaxis_title:str = None,
+        ):
+    '''
+    Builds the same figure as JANA_Plot.plot_pattern_with_hkl without showing it
+    so it can be made headlessly (e.g. in a worker process) and written to a file.
+
+    dataset: a single jana_data entry (e.g. jana_data[0])
+    title: the title of the figure
+    xaxis_title: if None, q (Å^-1) or 2θ°
+    other arguments: see JANA_Plot.plot_pattern_with_hkl
+    '''
+    # definitions: {{{
+    dictionaries, hkl_names, hkl_colors = get_hkl_traces(dataset, composite, clustered, hkl_names, hkl_colors)
+    profile = dataset.get('profile')
+    pattern = dataset.get('pattern', profile)
+    axis = 'q' if plot_vs_q else 'tth'
+    if plot_vs_q:
+        hovertemplate = 'q: %{x}<br>Intensity: %{y}'
+        default_xaxis_title = 'q (Å^-1)'
+    else:
+        hovertemplate = '2theta: %{x}<br>Intensity: %{y}'
+        default_xaxis_title = '2θ°'
+    if xaxis_title is None:
+        xaxis_title = default_xaxis_title
+    fig = go.Figure()
+    #}}}
+    # Plot the pattern: {{{
+    fig.add_trace(go.Scatter(x = pattern[axis], y = pattern['yobs'], name = 'Observed', mode = 'lines', line = dict(color = 'black'), hovertemplate = hovertemplate))
+    if profile is not None and show_calc:
+        fig.add_trace(go.Scatter(x = profile[axis], y = profile['ycalc'], name = 'Calculated', mode = 'lines', line = dict(color = 'red'), hovertemplate = hovertemplate))
+    if profile is not None and show_diff:
+        if diff_offset is None:
+            diff_offset = np.min(profile['yobs']) - np.max(profile['difference'])
+        fig.add_trace(go.Scatter(x = profile[axis], y = profile['difference'] + diff_offset, name = 'Difference', mode = 'lines', line = dict(color = 'grey'), hovertemplate = hovertemplate))
+    #}}}
+    # plot the dictionaries of hkls: {{{
+    for i, hklm_dict in enumerate(dictionaries):
+        ht = hklm_dict.get('ht', hklm_dict.get('hovertemplate'))
+        hklm_x = hklm_dict[axis]
+        fig.add_trace(go.Scatter(
+            x = hklm_x,
+            y = np.ones(len(hklm_x)) * (hkl_offset*(i + 1)),
+            name = hkl_names[i],
+            mode = 'markers',
+            marker = dict(symbol = 'line-ns', size = marker_size, line = dict(width = 1, color = hkl_colors[i])),
+            hovertemplate = ht,
+        ))
+    #}}}
+    fig.update_layout(height = height, width = width, title = title, xaxis_title = xaxis_title, yaxis_title = 'Intensity')
+    return fig
+#}}}
+# write_pattern_report: {{{
+def write_pattern_report(job:tuple = None):
+    '''
+    Worker used by render_reports. Builds one figure and writes it to html.
+    The plotly library is referenced from plotly.min.js in the same directory 
+    rather than being embedded in each page.
+
+    job: (dataset, filename, kwargs for build_pattern_figure)
+    '''
+    dataset, filename, kwargs = job
+    fig = build_pattern_figure(dataset, **kwargs)
+    fig.write_html(filename, include_plotlyjs = 'directory', full_html = True)
+    return filename
 #}}}
 # JANA_Plot: {{{
 class JANA_Plot(GenericPlotter, UsefulUnicode):
@@ -23,26 +160,42 @@ class JANA_Plot(GenericPlotter, UsefulUnicode):
             plot_vs_q:bool = False, 
             composite:bool = False,
             hkl_offset:int = -1800, 
-            hkl_names:list = ['main', 'satellites'],
-            hkl_colors:list = ['blue', 'orange'],
+            hkl_names:list = None,
+            hkl_colors:list = None,
             height:int = 650,
             width:int = 1000,
             marker_size:int = 8, 
+            show_calc:bool = False,
+            show_diff:bool = False,
+            diff_offset:float = None,
+            clustered:bool = False,
+            modulation_axis:str = None,
             ):
         '''
         jana_data: This is a dictionary created by jana_tools.py
         plot_vs_q: do you want to be on a q scale or a 2theta scale? 
         composite: Do you want to plot hkls separated as in a composite structure or not?
         hkl_offset: the standard separation for hkl ticks
-        hkl_names: a list of names for each of the hkls to be plotted.
-        hkl_colors: a list of colors for the hkls
+        hkl_names: a list of names for each of the hkls to be plotted. 
+                If None: main, satellites (or the composite categories)
+        hkl_colors: a list of colors for the hkls. If None, defaults match hkl_names
         height: height of the plot
         width: width of the plot
         marker_size: size of the hkl ticks
+        show_calc: plot the calculated profile from the prf file
+        show_diff: plot the difference curve from the prf file
+        diff_offset: the vertical offset of the difference curve. If None, it is placed just below the pattern
+        clustered: plot one tick per cluster from cluster_hklm (main, satellite, and mixed clusters) instead of every hkl
+        modulation_axis: if given with composite, categorize_composite_hklm is run for this axis first (cached after the first time)
         '''
+        if composite and modulation_axis is not None:
+            self.categorize_composite_hklm(index, modulation_axis)
         # definitions: {{{
-        pattern = jana_data[index]['pattern'] 
-        hklm_data = jana_data[index]['hklm_data']
+        profile = jana_data[index].get('profile')
+        if 'pattern' in jana_data[index]:
+            pattern = jana_data[index]['pattern'] 
+        else:
+            pattern = profile # The prf file has the observed pattern too
         yobs = pattern['yobs']
         # axis selection for pattern: {{{
         if plot_vs_q:
@@ -55,16 +208,7 @@ class JANA_Plot(GenericPlotter, UsefulUnicode):
             xaxis_title = f'2{self._theta}{self._degree_symbol}'
         #}}}
         # dictionaries for hkls: {{{
-        if composite:
-            composite_dicts = jana_data[index]['composite_hklm']
-            dictionaries = [
-                composite_dicts['primary'], 
-                composite_dicts['secondary'],
-                composite_dicts['common'],
-                composite_dicts['satellites'],
-            ]
-        else:
-            dictionaries = [hklm_data['main'], hklm_data['satellite']]
+        dictionaries, hkl_names, hkl_colors = get_hkl_traces(jana_data[index], composite, clustered, hkl_names, hkl_colors)
         #}}}
         #}}}
         # Plot the pattern: {{{
@@ -81,6 +225,30 @@ class JANA_Plot(GenericPlotter, UsefulUnicode):
             hovertemplate = hovertemplate,
         )
         #}}}
+        # Plot the calculated profile and difference: {{{
+        if profile is not None and (show_calc or show_diff):
+            profile_x = profile['q'] if plot_vs_q else profile['tth']
+            if show_calc:
+                self.add_data_to_plot(
+                    profile_x,
+                    profile['ycalc'],
+                    name = 'Calculated',
+                    color = 'red',
+                    mode = 'lines',
+                    hovertemplate = hovertemplate,
+                )
+            if show_diff:
+                if diff_offset is None:
+                    diff_offset = np.min(profile['yobs']) - np.max(profile['difference'])
+                self.add_data_to_plot(
+                    profile_x,
+                    profile['difference'] + diff_offset,
+                    name = 'Difference',
+                    color = 'grey',
+                    mode = 'lines',
+                    hovertemplate = hovertemplate,
+                )
+        #}}}
         # plot the dictionaries of hkls: {{{
         hkl_plot_count = 1 # Allows the position of the hkls to be adjusted.
         for i, hklm_dict in enumerate(dictionaries):
@@ -108,5 +276,95 @@ class JANA_Plot(GenericPlotter, UsefulUnicode):
         #}}}
         self.show_figure()
     #}}}
+    # plot_pattern_heatmap: {{{
+    def plot_pattern_heatmap(self,
+            series:dict = None,
+            jana_data:dict = None,
+            show_hkl:bool = True,
+            hkl_names:list = ['main', 'satellites'],
+            hkl_colors:list = ['blue', 'orange'],
+            colorscale:str = 'Viridis',
+            log_scale:bool = False,
+            height:int = 800,
+            width:int = 1000,
+            marker_size:int = 8,
+            show:bool = True,
+            ):
+        '''
+        Plots a series of patterns on a common grid as a 2D intensity map
+        with one row per dataset. 
+
+        series: the dictionary returned by resample_patterns (x_axis, x, indices, intensity)
+        jana_data: the jana_data dictionary. Needed for the hkl overlays
+        show_hkl: overlay the main and satellite reflection positions on each row
+        hkl_names: a list of names for each of the hkls to be plotted.
+        hkl_colors: a list of colors for the hkls
+        log_scale: plot log10 of the intensity
+        show: show the figure. Otherwise, the figure is just returned (it is also kept in self.fig)
+        '''
+        # definitions: {{{
+        x_axis = series['x_axis']
+        x = series['x']
+        indices = list(series['indices'])
+        rows = np.arange(len(indices))
+        z = np.asarray(series['intensity'])
+        if log_scale:
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                z = np.log10(np.where(z > 0, z, np.nan))
+        if x_axis == 'q':
+            xaxis_title = 'q (Å^-1)'
+        elif x_axis == 'tth':
+            xaxis_title = f'2{self._theta}{self._degree_symbol}'
+        else:
+            xaxis_title = x_axis
+        #}}}
+        # Set up the figure with the GenericPlotter layout: {{{
+        self.plot_data(
+            [],
+            [],
+            xaxis_title = xaxis_title,
+            yaxis_title = 'Dataset',
+            width = width,
+            height = height,
+        )
+        self.fig.data = () # Only the layout is kept
+        #}}}
+        # Plot the heatmap: {{{
+        self.fig.add_trace(go.Heatmap(
+            x = x,
+            y = rows,
+            z = z,
+            colorscale = colorscale,
+            hovertemplate = f'{x_axis}: %{{x}}<br>row: %{{y}}<br>Intensity: %{{z}}<extra></extra>',
+        ))
+        #}}}
+        # Overlay the hkls: {{{
+        if show_hkl and jana_data is not None:
+            for i, classification in enumerate(['main', 'satellite']):
+                hkl_x = []
+                hkl_y = []
+                hkl_text = []
+                for row, idx in zip(rows, indices):
+                    hklm_dict = jana_data[idx].get('hklm_data', {}).get(classification, {})
+                    positions = hklm_dict.get(x_axis, [])
+                    hkl_x.append(np.asarray(positions))
+                    hkl_y.append(np.full(len(positions), row))
+                    hkl_text.extend(hklm_dict.get('hovertemplate', ['']*len(positions)))
+                self.add_data_to_plot(
+                    np.concatenate(hkl_x) if hkl_x else [],
+                    np.concatenate(hkl_y) if hkl_y else [],
+                    name = hkl_names[i],
+                    symbol = 'line-ns',
+                    color = hkl_colors[i],
+                    hovertemplate = hkl_text,
+                    marker_size = marker_size,
+                )
+        #}}}
+        if len(rows) <= 50:
+            self.fig.update_layout(yaxis = dict(tickmode = 'array', tickvals = rows, ticktext = [str(idx) for idx in indices]))
+        if show:
+            self.show_figure()
+        return self.fig
+    #}}}
 
 #}}}